@@ -0,0 +1,276 @@
+"""
+Benchmarks of the notice pipeline.
+
+The `Benchmark` seeds users and notices and measures the handlers, views
+and the context processor. Each operation is repeated several times and
+a `Result` reports operations and notices per second, database queries
+per operation, latency percentiles and the peak memory of the process.
+
+The benchmarks are usually run by the `noticebox_benchmark` management
+command in a `ThrowawayEnvironment`, so that the configured databases, cache
+and broker are not touched. Emails are sent using the locmem backend so that
+nothing is delivered.
+"""
+
+import os
+import shutil
+import tempfile
+import time
+from threading import local
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core import mail
+from django.core.cache import get_cache
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+
+from noticebox.context_processors import notices as notices_processor
+from noticebox.handlers import mail_notice, save_notice, user_notice
+from noticebox.models import Notice
+from noticebox.views import NoticeDetailView, NoticeListView
+
+
+LOCMEM_EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+LOCMEM_BROKER = 'noticebox.pubsub.LocMemBroker'
+CACHE_ALIAS = 'noticebox-benchmark'
+
+
+def _percentile(values, percent):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[int(round((len(values) - 1) * percent / 100.0))]
+
+
+def peak_memory():
+    """
+    Returns the peak resident memory of the whole process.
+
+    The value is in kilobytes on Linux (but in bytes on Mac OS X). None is
+    returned if it is not available.
+    """
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class ThrowawayEnvironment(object):
+    """
+    Replaces databases, the notice cache and the broker by throwaway ones.
+
+    Each configured database alias (including shards) is connected to
+    a new SQLite database in a temporary directory and tables are created
+    by `syncdb`. If `NOTICEBOX_CACHE` or `NOTICEBOX_BROKER` are configured
+    then a new local memory cache and `LocMemBroker` are used instead. The
+    original configuration is restored and the databases are deleted when
+    the environment is left.
+    """
+
+    def __enter__(self):
+        self.directory = tempfile.mkdtemp(prefix='noticebox-benchmark-')
+        self.databases = connections.databases
+        self.connections = connections._connections
+        connections.databases = dict(
+            (alias, {'ENGINE': 'django.db.backends.sqlite3',
+                     'NAME': os.path.join(self.directory, '%s.db' % alias)})
+            for alias in self.databases)
+        connections._connections = local()
+        overrides = {'CACHES': dict(settings.CACHES, **{CACHE_ALIAS: {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': self.directory,
+        }})}
+        if getattr(settings, 'NOTICEBOX_CACHE', None):
+            overrides['NOTICEBOX_CACHE'] = CACHE_ALIAS
+        if getattr(settings, 'NOTICEBOX_BROKER', None):
+            overrides['NOTICEBOX_BROKER'] = LOCMEM_BROKER
+        self.settings = override_settings(**overrides)
+        self.settings.enable()
+        try:
+            for alias in connections:
+                call_command('syncdb', database=alias, interactive=False,
+                             verbosity=0)
+        except:
+            self.__exit__(None, None, None)
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        get_cache(CACHE_ALIAS).clear()
+        self.settings.disable()
+        for conn in connections.all():
+            conn.close()
+        connections.databases = self.databases
+        connections._connections = self.connections
+        # Content types created by syncdb have ids of the throwaway database.
+        ContentType.objects.clear_cache()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class Result(object):
+    """
+    Measurements of a single benchmarked operation.
+    """
+
+    def __init__(self, name, timings, queries, notices=0):
+        self.name = name
+        self.timings = timings
+        self.queries = queries
+        self.notices = notices
+
+    @property
+    def ops_per_second(self):
+        total = sum(self.timings)
+        return len(self.timings) / total if total else 0.0
+
+    @property
+    def notices_per_second(self):
+        return self.notices * self.ops_per_second
+
+    @property
+    def queries_per_op(self):
+        return float(sum(self.queries)) / len(self.queries)
+
+    @property
+    def p50(self):
+        return _percentile(self.timings, 50)
+
+    @property
+    def p99(self):
+        return _percentile(self.timings, 99)
+
+    def format(self):
+        return '%-20s %10.1f %10.1f %8.1f %9.2f %9.2f' % (
+            self.name, self.ops_per_second, self.notices_per_second,
+            self.queries_per_op, self.p50 * 1000, self.p99 * 1000)
+
+    @classmethod
+    def format_header(cls):
+        return '%-20s %10s %10s %8s %9s %9s' % (
+            'operation', 'ops/s', 'notices/s', 'queries', 'p50 ms', 'p99 ms')
+
+
+class Benchmark(object):
+    """
+    Seeds users and notices and measures operations of the application.
+
+    `users` is the number of created users (and recipients of each handler
+    call), `notices` is the number of notices created for each user before
+    views are measured and `repeat` is the number of runs of each operation.
+    """
+
+    operations = ('save_notice', 'mail_notice', 'user_notice',
+                  'list_view', 'detail_view', 'context_processor')
+
+    def __init__(self, users=100, notices=20, repeat=10):
+        self.user_count = users
+        self.notice_count = notices
+        self.repeat = repeat
+        self.users = []
+        self.detail_notices = []
+        self.request_factory = RequestFactory()
+
+    def setup(self):
+        """
+        Creates users and their notices.
+        """
+        User.objects.bulk_create([
+            User(username='noticebox-bench-%d' % i,
+                 email='bench%d@example.com' % i)
+            for i in range(self.user_count)])
+        self.users = list(User.objects.filter(
+            username__startswith='noticebox-bench-').order_by('pk'))
+        for i in range(self.notice_count):
+            save_notice(self.users, subject='Notice %d' % i,
+                        body='Body of notice %d' % i)
+        # Notices displayed by the detail view, a different one in each run.
+        self.detail_notices = []
+        for i in range(min(self.repeat, self.notice_count * self.user_count)):
+            user = self.users[i % len(self.users)]
+            notices = Notice.objects.for_user(user).order_by('pk')
+            self.detail_notices.append((user, notices.values_list(
+                'pk', flat=True)[i // len(self.users)]))
+
+    def run(self, operations=None):
+        """
+        Runs given operations (all by default) and returns their results.
+        """
+        if not self.users:
+            self.setup()
+        results = []
+        with override_settings(EMAIL_BACKEND=LOCMEM_EMAIL_BACKEND):
+            for name in operations or self.operations:
+                func = getattr(self, 'bench_%s' % name, None)
+                if func is None:
+                    raise ValueError("Unknown operation: %r" % (name,))
+                results.append(self.measure(name, func))
+        return results
+
+    def measure(self, name, func):
+        """
+        Runs the function `repeat` times and returns a Result.
+
+        The function is called with the number of the run and it should
+        return the number of processed notices.
+        """
+        timings, queries = [], []
+        notices = 0
+        use_debug_cursor = connection.use_debug_cursor
+        connection.use_debug_cursor = True
+        try:
+            for i in range(self.repeat):
+                del connection.queries[:]
+                start = time.time()
+                notices = func(i)
+                timings.append(time.time() - start)
+                queries.append(len(connection.queries))
+                mail.outbox = []
+        finally:
+            connection.use_debug_cursor = use_debug_cursor
+            del connection.queries[:]
+        return Result(name, timings, queries, notices)
+
+    def get_request(self, user, path='/'):
+        request = self.request_factory.get(path)
+        request.user = user
+        return request
+
+    def bench_save_notice(self, i):
+        save_notice(self.users, subject='Benchmark', body='Benchmark body')
+        return len(self.users)
+
+    def bench_mail_notice(self, i):
+        mail_notice(self.users, subject='Benchmark', body='Benchmark body')
+        return len(self.users)
+
+    def bench_user_notice(self, i):
+        user_notice(self.users, subject='Benchmark', body='Benchmark body')
+        return len(self.users)
+
+    def bench_list_view(self, i):
+        user = self.users[i % len(self.users)]
+        response = NoticeListView.as_view()(self.get_request(user))
+        response.render()
+        return len(response.context_data['object_list'])
+
+    def bench_detail_view(self, i):
+        if not self.detail_notices:
+            raise ValueError("The detail view requires seeded notices.")
+        user, pk = self.detail_notices[i % len(self.detail_notices)]
+        response = NoticeDetailView.as_view()(self.get_request(user), pk=pk)
+        response.render()
+        return 1
+
+    def bench_context_processor(self, i):
+        user = self.users[i % len(self.users)]
+        context = notices_processor(self.get_request(user))
+        context['notice_unread_count']()
+        return 0
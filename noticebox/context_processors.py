@@ -2,6 +2,11 @@
 Django context processors.
 """
 
+from django.conf import settings
+from django.db import connections
+
+from noticebox.counters import count_unread, has_stored_counts
+from noticebox.instrumentation import measure
 from noticebox.models import Notice
 
 
@@ -17,20 +22,106 @@ class LazyCount(object):
         try:
             return self._count
         except AttributeError:
-            self._count = self.queryset.count()
+            with measure('count', type(self)) as timer:
+                self._count = timer.count = self.get_count()
         return self._count
 
+    def get_count(self):
+        return self.queryset.count()
+
+
+class LazyUnreadNotices(object):
+    """
+    Delays loading of user's newest unread notices until they are needed.
+
+    At most `limit` notices are loaded together with the number of all
+    unread notices (computed by a subquery) using a single query.
+    """
+
+    def __init__(self, user, limit):
+        self.user = user
+        self.limit = limit
+
+    def __iter__(self):
+        return iter(self._load()[0])
+
+    def __len__(self):
+        return len(self._load()[0])
+
+    def is_loaded(self):
+        return hasattr(self, '_loaded')
+
+    def count(self):
+        """
+        Returns number of all unread notices of the user.
+        """
+        return self._load()[1]
+
+    def _load(self):
+        try:
+            return self._loaded
+        except AttributeError:
+            pass
+        queryset = Notice.objects.list_for_user(self.user).filter(atime=None)
+        qn = connections[queryset.db].ops.quote_name
+        opts = Notice._meta
+        count_sql = 'SELECT COUNT(*) FROM %s WHERE %s = %%s AND %s IS NULL' % (
+            qn(opts.db_table), qn(opts.get_field('user').column),
+            qn(opts.get_field('atime').column))
+        queryset = queryset.extra(select={'unread_count': count_sql},
+                                  select_params=[self.user.pk])
+        notices = list(queryset.order_by('-ctime', '-pk')[:self.limit])
+        count = notices[0].unread_count if notices else 0
+        self._loaded = (notices, count)
+        return self._loaded
+
+
+class LazyUnreadCount(LazyCount):
+    """
+    Delays counting of user's unread notices until is actually needed.
+
+    The count may be taken from the cache, see the `noticebox.counters`.
+    If it is not stored anywhere then it is loaded together with the list
+    of unread notices (if given).
+    """
+
+    def __init__(self, user, unread_notices=None):
+        self.user = user
+        self.unread_notices = unread_notices
+
+    def get_count(self):
+        unread_notices = self.unread_notices
+        if unread_notices is not None and (
+                unread_notices.is_loaded() or not has_stored_counts()):
+            return unread_notices.count()
+        return count_unread(self.user)
+
 
 def notices(request):
     """
-    Adds `notice_unread_count` to template context.
+    Adds `notice_unread_count` and `notice_unread_list` to template context.
 
-    No database query is executed until necessary.
+    The list contains at most `NOTICEBOX_UNREAD_LIST_SIZE` newest unread
+    notices (5 by default). No database query is executed until necessary,
+    both values are loaded by a single query unless the count is cached.
+    The result is stored in the request so that all templates rendered
+    using the request share the same values. It is stored together with
+    the id of the user, so it is not reused after `login` or `logout`.
     """
     user = getattr(request, 'user', None)
-    if user and user.is_authenticated():
-        queryset = Notice.objects.for_user(user).filter(atime=None)
-        return {
-            'notice_unread_count': LazyCount(queryset),
-        }
-    return {}
+    user_id = user.pk if user and user.is_authenticated() else None
+    memo = getattr(request, '_noticebox_context', None)
+    if memo is not None and memo[0] == user_id:
+        context = memo[1]
+    else:
+        context = {}
+        if user_id is not None:
+            limit = getattr(settings, 'NOTICEBOX_UNREAD_LIST_SIZE', 5)
+            unread_notices = LazyUnreadNotices(user, limit)
+            context = {
+                'notice_unread_count': LazyUnreadCount(user, unread_notices),
+                'notice_unread_list': unread_notices,
+            }
+        request._noticebox_context = (user_id, context)
+    # The dictionary can be modified by the template context.
+    return dict(context)
@@ -0,0 +1,158 @@
+"""
+Counting of unread notices.
+
+If the `NOTICEBOX_CACHE` setting contains an alias of a configured cache then
+unread notice counts are kept in that cache. Cached counts are updated when
+notices are created, read or deleted (using signals), a count missing in
+the cache is computed from the database on demand.
+
+If the `NOTICEBOX_COUNTERS` setting is enabled then unread and total counts
+are stored in the `NoticeCounter` table. Counters are kept consistent
+using the same signals and they can be rebuilt using
+the `noticebox_rebuild_counters` management command.
+
+The time of the last change of user's notices (used by conditional
+requests of the poll view) is kept in the same cache.
+"""
+
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import get_cache
+from django.db.models import Max
+from django.dispatch import receiver
+from django.utils import timezone
+
+from noticebox.models import Notice, NoticeCounter
+from noticebox.signals import notices_created, notices_deleted, notices_read
+
+
+def _get_cache():
+    alias = getattr(settings, 'NOTICEBOX_CACHE', None)
+    if alias is None:
+        return None
+    return get_cache(alias)
+
+
+def _use_counters():
+    return getattr(settings, 'NOTICEBOX_COUNTERS', False)
+
+
+def _get_key(user_id):
+    return 'noticebox:unread:%s' % user_id
+
+
+def _get_modified_key(user_id):
+    return 'noticebox:modified:%s' % user_id
+
+
+def _update_count(cache, user_id, delta):
+    try:
+        cache.incr(_get_key(user_id), delta)
+    except ValueError:
+        # The count is not cached, it will be computed when needed.
+        pass
+
+
+def _count_unread(user):
+    if _use_counters():
+        return NoticeCounter.objects.for_user(user).unread
+    return Notice.objects.for_user(user).filter(atime=None).count()
+
+
+def has_stored_counts():
+    """
+    Returns whether unread counts are kept in the cache or in counters.
+    """
+    return _get_cache() is not None or _use_counters()
+
+
+def count_unread(user):
+    """
+    Returns number of unread notices of the given user.
+    """
+    cache = _get_cache()
+    if cache is None:
+        return max(_count_unread(user), 0)
+    key = _get_key(user.pk)
+    count = cache.get(key)
+    if count is None:
+        count = _count_unread(user)
+        cache.add(key, count)
+    return max(count, 0)
+
+
+def last_modified(user):
+    """
+    Returns time of the last change of user's notices.
+
+    Returns None if the user has no notices. Only the cache is used if
+    the time is cached there, otherwise it is computed from the latest
+    creation and access times of the notices.
+    """
+    cache = _get_cache()
+    key = _get_modified_key(user.pk)
+    if cache is not None:
+        modified = cache.get(key)
+        if modified is not None:
+            return modified
+    times = Notice.objects.for_user(user).aggregate(
+        ctime=Max('ctime'), atime=Max('atime'))
+    modified = max([t for t in times.values() if t is not None] or [None])
+    if modified is not None and cache is not None:
+        cache.add(key, modified)
+    return modified
+
+
+def _touch(user_ids):
+    cache = _get_cache()
+    if cache is not None:
+        now = timezone.now()
+        cache.set_many(dict((_get_modified_key(user_id), now)
+                            for user_id in set(user_ids)))
+
+
+def _update_counts(notices, sign):
+    unread = defaultdict(int)
+    total = defaultdict(int)
+    for notice in notices:
+        total[notice.user_id] += sign
+        if notice.atime is None:
+            unread[notice.user_id] += sign
+    if _use_counters():
+        # Group users by deltas so that one query updates many counters.
+        users_by_deltas = defaultdict(list)
+        for user_id in total:
+            users_by_deltas[unread[user_id], total[user_id]].append(user_id)
+        for (unread_delta, total_delta), user_ids in users_by_deltas.items():
+            NoticeCounter.objects.update_counts(
+                user_ids, unread=unread_delta, total=total_delta)
+    cache = _get_cache()
+    if cache is not None:
+        for user_id, delta in unread.items():
+            if delta:
+                _update_count(cache, user_id, delta)
+
+
+@receiver(notices_created, dispatch_uid='noticebox.counters.notices_created')
+def increment_counts(sender, notices, **kwargs):
+    _update_counts(notices, 1)
+    _touch(notice.user_id for notice in notices)
+
+
+@receiver(notices_deleted, dispatch_uid='noticebox.counters.notices_deleted')
+def decrement_counts(sender, notices, **kwargs):
+    _update_counts(notices, -1)
+    _touch(notice.user_id for notice in notices)
+
+
+@receiver(notices_read, dispatch_uid='noticebox.counters.notices_read')
+def decrement_unread_count(sender, user, count, **kwargs):
+    if not count:
+        return
+    _touch([user.pk])
+    if _use_counters():
+        NoticeCounter.objects.update_counts([user.pk], unread=-count)
+    cache = _get_cache()
+    if cache is not None:
+        _update_count(cache, user.pk, -count)
@@ -8,16 +8,35 @@ implemented as callable classes so that they can be easily customized.
 If the default functionality is sufficient then `save_notice`
 and `mail_notice` global instances can be used (and class bases
 implementation can be ignored). The `user_notice` function is a shortcut
-for calling both `save_notice` and `mail_notice`.
+for calling both `save_notice` and `mail_notice`, the `bulk_notice` function
+does the same for notices with different presets and arguments for each
+user.
 """
 
-
+import threading
+from collections import deque
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+
+from django.conf import settings
+from django.contrib.auth.models import User
 from django.core.mail import EmailMessage
 from django.core.mail import get_connection
+from django.db import connections
+from django.db.models import FieldDoesNotExist, Q
 from django.template import Context
 from django.template.loader import get_template
+from django.utils import six
 
-from noticebox.models import Notice
+from noticebox.instrumentation import measure
+from noticebox.mail import ConnectionPool, DeliveryError, send_parallel
+from noticebox.models import Notice, NoticeContent
+from noticebox.routers import shard_for_user
+from noticebox.signals import notices_created
 
 
 def _user_list(user_or_user_list):
@@ -26,33 +45,451 @@ def _user_list(user_or_user_list):
     return user_or_user_list
 
 
+def _user_iterator(user_or_user_list, batch_size=None, hints=None):
+    """
+    Returns an iterable over the given users.
+
+    Querysets are restricted by the given recipient hints, lists of users
+    are returned as they are (hints are not applied to them). If a batch
+    size is given then querysets are fetched in chunks (keeping their
+    ordering) so that the users are not stored in the queryset result cache.
+    """
+    users = _user_list(user_or_user_list)
+    if not hasattr(users, 'iterator'):
+        return users
+    if hints:
+        users = _apply_hints(users, hints)
+    if batch_size:
+        if users.query.can_filter():
+            return _chunked_iterator(users, batch_size)
+        # Sliced querysets cannot be filtered.
+        return users.iterator()
+    return users
+
+
+def _apply_hints(queryset, hints):
+    """
+    Applies `select_related`, `prefetch_related` and `only` hints.
+    """
+    if hints.get('select_related'):
+        queryset = queryset.select_related(*hints['select_related'])
+    if hints.get('prefetch_related'):
+        queryset = queryset.prefetch_related(*hints['prefetch_related'])
+    if hints.get('only'):
+        queryset = queryset.only(*hints['only'])
+    return queryset
+
+
+def _merge_hints(*hints_list):
+    """
+    Returns recipient hints satisfying all the given hints.
+    """
+    merged = {}
+    for key in ('select_related', 'prefetch_related', 'only'):
+        values = []
+        for hints in hints_list:
+            if key == 'only' and not hints.get(key):
+                # All fields are needed by someone.
+                values = []
+                break
+            values.extend(v for v in hints.get(key, ()) if v not in values)
+        if values:
+            merged[key] = values
+    return merged
+
+
+def _keyset_ordering(queryset):
+    """
+    Returns the ordering of the queryset as `(attname, descending)` pairs.
+
+    The primary key is appended so that the ordering is unique. Returns
+    None if the ordering uses fields which cannot be compared in a filter
+    (related or nullable fields, extra ordering or a random order).
+    """
+    query = queryset.query
+    if query.extra_order_by:
+        return None
+    ordering = query.order_by
+    if not ordering and query.default_ordering:
+        ordering = queryset.model._meta.ordering
+    opts = queryset.model._meta
+    result = []
+    for item in ordering:
+        if not isinstance(item, six.string_types):
+            return None
+        name = item.lstrip('-')
+        if name == 'pk':
+            name = opts.pk.name
+        try:
+            field = opts.get_field(name)
+        except FieldDoesNotExist:
+            return None
+        if field.null or field.rel:
+            return None
+        result.append((field.attname, item.startswith('-')))
+    if opts.pk.attname not in [name for name, descending in result]:
+        result.append((opts.pk.attname, False))
+    return result
+
+
+def _keyset_filter(ordering, obj):
+    """
+    Returns a Q object selecting objects following the given object.
+    """
+    condition = None
+    equal = Q()
+    for name, descending in ordering:
+        value = getattr(obj, name)
+        lookup = '%s__%s' % (name, 'lt' if descending else 'gt')
+        following = equal & Q(**{lookup: value})
+        condition = following if condition is None else condition | following
+        equal &= Q(**{name: value})
+    return condition
+
+
+def _chunked_iterator(queryset, chunk_size):
+    """
+    Iterates over the queryset in chunks keeping its ordering.
+
+    The primary key is added to the ordering and each chunk is selected by
+    a separate query which continues after the last object of the previous
+    chunk. If the ordering cannot be continued this way (see
+    `_keyset_ordering`) then chunks are selected using offsets. Prefetched
+    relations are loaded for each chunk.
+    """
+    ordering = _keyset_ordering(queryset)
+    if ordering is None:
+        order_by = list(queryset.query.order_by)
+        if '?' not in order_by:
+            queryset = queryset.order_by(*(order_by + ['pk']))
+        offset = 0
+        while True:
+            chunk = list(queryset[offset:offset + chunk_size])
+            for obj in chunk:
+                yield obj
+            if len(chunk) < chunk_size:
+                break
+            offset += chunk_size
+        return
+    queryset = queryset.order_by(*[('-' if descending else '') + name
+                                   for name, descending in ordering])
+    chunk = list(queryset[:chunk_size])
+    while chunk:
+        for obj in chunk:
+            yield obj
+        if len(chunk) < chunk_size:
+            break
+        chunk = list(queryset.filter(
+            _keyset_filter(ordering, chunk[-1]))[:chunk_size])
+
+
+def _overrides(handler, cls, name):
+    """
+    Returns whether the class of the handler overrides a method of `cls`.
+    """
+    method = getattr(type(handler), name)
+    original = getattr(cls, name)
+    return (getattr(method, '__func__', method)
+            is not getattr(original, '__func__', original))
+
+
+def _batches(iterable, batch_size=None):
+    """
+    Splits the given iterable to lists of at most `batch_size` items.
+
+    All items are returned in a single list if no batch size is given.
+    """
+    if not batch_size:
+        batch = list(iterable)
+        if batch:
+            yield batch
+        return
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _item_batches(items, contexts, batch_size):
+    """
+    Yields batches of `(user, preset, kwargs)` items with their contexts.
+
+    The `contexts` list (of the same length as the items) is split the same
+    way as the items, None is yielded if no contexts are given.
+    """
+    offset = 0
+    for batch in _batches(items, batch_size):
+        batch_contexts = None
+        if contexts is not None:
+            batch_contexts = contexts[offset:offset + len(batch)]
+        offset += len(batch)
+        yield batch, batch_contexts
+
+
+# The handler used by a rendering process and connections it inherited.
+_render_handler = None
+_inherited_connections = []
+
+
+def _init_render_process(handler):
+    """
+    Initializes a process of the process pool used for rendering.
+    """
+    global _render_handler
+    _render_handler = handler
+    # Database connections of the parent process must not be used (nor
+    # closed) by the child process, references are kept so that they are
+    # not closed when garbage collected. In-memory SQLite databases cannot
+    # be opened again, the child uses its own copy of them.
+    for connection in connections.all():
+        if (connection.vendor == 'sqlite' and
+                connection.settings_dict['NAME'] in ('', ':memory:')):
+            continue
+        _inherited_connections.append(connection.connection)
+        connection.connection = None
+
+
+def _render_user_ids(user_ids, preset, kwargs):
+    """
+    Renders notices for users with the given ids in a rendering process.
+
+    None is returned instead of the subject and body of users which were
+    not found, they are rendered by the parent process.
+    """
+    users = _render_handler.get_users(user_ids, preset)
+    found = [user for user in users if user is not None]
+    rendered = iter(_render_handler.render_users(found, preset, kwargs))
+    return [next(rendered) if user is not None else None for user in users]
+
+
 class BaseHandler(object):
     """
     Provides common functionality to both DatabaseHandler and EmailHandler.
+
+    Presets listed in `invariant_presets` are considered to be independent
+    of the recipient. Their templates are rendered only once per call
+    (with `None` as the user) and the result is used for all users.
+
+    Compiled templates are cached by the handler. The cache can be emptied
+    using `clear_template_cache`, it is not used at all if `cache_templates`
+    is false. By default templates are cached unless `DEBUG` is enabled.
+
+    If `render_workers` is greater than one then notices are rendered in
+    parallel by a pool of processes (or threads if `render_pool` is
+    `'thread'`). Users are split to chunks of `render_chunk_size` users,
+    processes receive only user ids and keyword arguments (which must be
+    picklable) and they load users using `get_users`. Users which are not
+    visible to the processes (for example users created by a transaction
+    which is not committed yet) are rendered by the calling process.
+    Results are returned in the original order of users.
+
+    Recipient querysets can be optimized for templates of each preset.
+    The `recipient_hints` dictionary maps presets to dictionaries with
+    `select_related`, `prefetch_related` and `only` lists which are
+    applied to the querysets, for example: ::
+
+        {'welcome': {'only': ['username'], 'prefetch_related': ['groups']}}
+
+    Hints are not applied to users given as a list (or a single user),
+    such users are already loaded.
     """
 
     default_preset = 'default'
     default_subject_template = None
     default_body_template = None
+    default_invariant_presets = ()
+    default_recipient_hints = {}
+    # Fields which are always loaded by handlers.
+    required_recipient_fields = ()
+    default_render_workers = 1
+    default_render_pool = 'process'
+    render_chunk_size = 100
 
     def __init__(self, preset=None, subject_template=None, body_template=None,
+                 invariant_presets=None, cache_templates=None,
+                 render_workers=None, render_pool=None, recipient_hints=None,
                  **kwargs):
         self.preset = preset or self.default_preset
         self.subject_template = subject_template or self.default_subject_template
         self.body_template = body_template or self.default_body_template
+        if invariant_presets is None:
+            invariant_presets = self.default_invariant_presets
+        self.invariant_presets = frozenset(invariant_presets)
+        if recipient_hints is None:
+            recipient_hints = self.default_recipient_hints
+        self.recipient_hints = recipient_hints
+        self.cache_templates = cache_templates
+        self.render_workers = render_workers or self.default_render_workers
+        self.render_pool = render_pool or self.default_render_pool
+        if self.render_pool not in ('process', 'thread'):
+            raise ValueError("Invalid render pool: %r" % (self.render_pool,))
+        self._templates = {}
         super(BaseHandler, self).__init__(**kwargs)
 
-    def render(self, user, preset=None, **kwargs):
+    def render(self, user, preset=None, _context=None, **kwargs):
         """
         Renders and returns notice subject and body.
+
+        A context returned by `get_context` can be given as `_context` if it
+        was already created for the user. Template variables cannot start
+        with an underscore, so the name does not collide with kwargs.
         """
         if preset is None:
             preset = self.preset
-        context = self.get_context(user, **kwargs)
-        subject = self.get_subject_template(user, preset).render(context)
-        body = self.get_body_template(user, preset).render(context)
+        with measure('render', self, 1):
+            context = _context
+            if context is None:
+                context = self.get_context(user, **kwargs)
+            subject = self.get_subject_template(user, preset).render(context)
+            body = self.get_body_template(user, preset).render(context)
         return subject, body
 
+    def render_all(self, users, preset=None, _contexts=None, **kwargs):
+        """
+        Renders notice subject and body for each of the given users.
+
+        Yields `(user, subject, body)` tuples. Already created contexts can
+        be given as `_contexts`, a dictionary mapping user ids to contexts.
+        They are not used by the parallel rendering.
+        """
+        if preset is None:
+            preset = self.preset
+        if self.is_invariant(preset):
+            rendered = None
+            for user in users:
+                if rendered is None:
+                    rendered = self.render(None, preset, **kwargs)
+                yield (user,) + rendered
+        elif self.render_workers > 1:
+            for item in self.render_parallel(users, preset, kwargs):
+                yield item
+        else:
+            contexts = _contexts or {}
+            for user in users:
+                context = contexts.get(user.pk)
+                yield (user,) + self.render(user, preset, context, **kwargs)
+
+    def render_items(self, items, contexts=None):
+        """
+        Renders notices for a list of `(user, preset, kwargs)` items.
+
+        Yields `(user, subject, body)` tuples grouped by preset (items of
+        each group keep their order). An invariant preset is rendered only
+        once for consecutive items of its group with equal arguments.
+        Already created contexts can be given as a list of the same length
+        as the items.
+        """
+        presets = []
+        groups = {}
+        for i, (user, preset, kwargs) in enumerate(items):
+            preset = preset or self.preset
+            if preset not in groups:
+                presets.append(preset)
+                groups[preset] = []
+            groups[preset].append(i)
+        for preset in presets:
+            invariant = self.is_invariant(preset)
+            previous = None
+            for i in groups[preset]:
+                user, _, kwargs = items[i]
+                if not invariant:
+                    context = contexts[i] if contexts is not None else None
+                    rendered = self.render(user, preset, context, **kwargs)
+                elif previous is None or previous[0] != kwargs:
+                    rendered = self.render(None, preset, **kwargs)
+                    previous = (kwargs, rendered)
+                yield (user,) + rendered
+
+    def render_parallel(self, users, preset, kwargs):
+        """
+        Renders notices for the given users using a pool of workers.
+
+        Users are iterated (and chunks are submitted) in the calling thread,
+        at most `render_workers` chunks are rendered ahead of the consumer.
+        """
+        if self.render_pool == 'thread':
+            pool = ThreadPool(self.render_workers)
+            render = lambda chunk: pool.apply_async(
+                self._render_in_thread, (chunk, preset, kwargs))
+        else:
+            pool = Pool(self.render_workers, _init_render_process, (self,))
+            render = lambda chunk: pool.apply_async(
+                _render_user_ids, ([user.pk for user in chunk], preset, kwargs))
+        pending = deque()
+
+        def results():
+            chunk, result = pending.popleft()
+            for user, rendered in zip(chunk, result.get()):
+                if rendered is None:
+                    rendered = self.render(user, preset, **kwargs)
+                yield (user,) + rendered
+
+        try:
+            for chunk in _batches(users, self.render_chunk_size):
+                pending.append((chunk, render(chunk)))
+                if len(pending) > self.render_workers:
+                    for item in results():
+                        yield item
+            while pending:
+                for item in results():
+                    yield item
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def _render_in_thread(self, users, preset, kwargs):
+        try:
+            return self.render_users(users, preset, kwargs)
+        finally:
+            for connection in connections.all():
+                connection.close()
+
+    def render_users(self, users, preset, kwargs):
+        """
+        Returns a list of rendered `(subject, body)` tuples for given users.
+        """
+        return [self.render(user, preset, **kwargs) for user in users]
+
+    def get_users(self, user_ids, preset=None):
+        """
+        Returns users with the given ids in the same order.
+
+        Used by rendering processes which receive only user ids. None is
+        returned instead of users which do not exist.
+        """
+        queryset = _apply_hints(User.objects.all(),
+                                self.get_recipient_hints(preset))
+        users = queryset.in_bulk(user_ids)
+        return [users.get(user_id) for user_id in user_ids]
+
+    def get_recipient_hints(self, preset=None):
+        """
+        Returns hints for recipient querysets of the given preset.
+        """
+        hints = dict(self.recipient_hints.get(preset or self.preset, {}))
+        if hints.get('only'):
+            hints['only'] = list(hints['only']) + [
+                field for field in self.required_recipient_fields
+                if field not in hints['only']]
+        return hints
+
+    def get_recipients(self, users, preset=None, batch_size=None):
+        """
+        Returns an iterable over the given users using recipient hints.
+        """
+        return _user_iterator(users, batch_size,
+                              self.get_recipient_hints(preset))
+
+    def is_invariant(self, preset):
+        """
+        Returns whether templates of the given preset are user independent.
+        """
+        return preset in self.invariant_presets
+
     def get_context(self, user, **kwargs):
         """
         Returns a template context for subject and body rendering.
@@ -63,98 +500,431 @@ class BaseHandler(object):
         """
         Returns a template to be used for subject rendering.
         """
-        return get_template(self.subject_template % {'preset': preset})
+        return self.load_template(self.subject_template % {'preset': preset})
 
     def get_body_template(self, user, preset):
         """
         Returns a template to be used for body rendering.
         """
-        return get_template(self.body_template % {'preset': preset})
+        return self.load_template(self.body_template % {'preset': preset})
+
+    def load_template(self, template_name):
+        """
+        Returns a compiled template, template loaders are used only once.
+        """
+        cache_templates = self.cache_templates
+        if cache_templates is None:
+            cache_templates = not settings.DEBUG
+        if not cache_templates:
+            return get_template(template_name)
+        try:
+            return self._templates[template_name]
+        except KeyError:
+            template = get_template(template_name)
+            self._templates[template_name] = template
+            return template
+
+    def clear_template_cache(self):
+        """
+        Forgets all compiled templates so that they are loaded again.
+        """
+        self._templates = {}
 
 
 class DatabaseHandler(BaseHandler):
     """
     Saves notices in the database so that they can be later displayed on web.
+
+    If a `batch_size` is given then users are iterated lazily and notices
+    are rendered and saved in batches of the given size. This keeps memory
+    usage constant even if a notice is sent to a huge user queryset.
+
+    If `deduplicate` is enabled then subjects and bodies are stored only once
+    in the NoticeContent table and notices only reference them. This is
+    useful for announcements sent to many users with the same content.
+
+    Notices are created by `create_notice`. If a subclass does not override
+    it then notices are rendered by `render_all` (so that invariant presets,
+    parallel rendering and shared contexts can be used) and created by
+    `build_notice`.
     """
 
     default_subject_template = 'noticebox/%(preset)s/web_subject.html'
     default_body_template = 'noticebox/%(preset)s/web_body.html'
-
-    def __init__(self, **kwargs):
+    default_batch_size = None
+    default_deduplicate = False
+
+    def __init__(self, batch_size=None, deduplicate=None, **kwargs):
+        self.batch_size = batch_size or self.default_batch_size
+        if deduplicate is None:
+            deduplicate = self.default_deduplicate
+        self.deduplicate = deduplicate
         super(DatabaseHandler, self).__init__(**kwargs)
 
-    def __call__(self, users, preset=None, **kwargs):
+    def __call__(self, users, preset=None, batch_size=None, _contexts=None,
+                 **kwargs):
         """
         Creates notices and saves them in database.
+
+        Template contexts created by `get_context` can be given as
+        `_contexts` (see `render_all`).
         """
-        notices = [self.create_notice(user, preset, **kwargs)
-                   for user in _user_list(users)]
-        self.save_notices(notices)
+        if batch_size is None:
+            batch_size = self.batch_size
+        with measure('database_handler', self) as timer:
+            users = timer.count_items(
+                self.get_recipients(users, preset, batch_size))
+            if _overrides(self, DatabaseHandler, 'create_notice'):
+                notices = (self.create_notice(user, preset, **kwargs)
+                           for user in users)
+            else:
+                rendered = self.render_all(users, preset, _contexts, **kwargs)
+                notices = (self.build_notice(user, subject, body)
+                           for user, subject, body in rendered)
+            for batch in _batches(notices, batch_size):
+                self.save_notices(batch)
+
+    def bulk(self, items, batch_size=None, contexts=None):
+        """
+        Creates notices for `(user, preset, kwargs)` items and saves them.
+
+        Each user can get a notice with a different preset and arguments,
+        notices are saved using one insert per batch.
+        """
+        if batch_size is None:
+            batch_size = self.batch_size
+        with measure('database_handler', self) as timer:
+            items = timer.count_items(items)
+            for batch, batch_contexts in _item_batches(items, contexts,
+                                                       batch_size):
+                if _overrides(self, DatabaseHandler, 'create_notice'):
+                    notices = [self.create_notice(user, preset, **kwargs)
+                               for user, preset, kwargs in batch]
+                else:
+                    notices = [self.build_notice(user, subject, body)
+                               for user, subject, body in self.render_items(
+                                   batch, batch_contexts)]
+                self.save_notices(notices)
 
     def create_notice(self, user, preset, **kwargs):
         """
         Creates and returns Notice instances for the given user.
         """
         subject, body = self.render(user, preset, **kwargs)
+        return self.build_notice(user, subject, body)
+
+    def build_notice(self, user, subject, body):
+        """
+        Returns a Notice instance with already rendered subject and body.
+        """
         return Notice(user=user, subject=subject, body=body)
 
     def save_notices(self, notices):
         """
         Saves given notices to database.
+
+        If notices are sharded then each of them is saved to the database
+        of its user, see `noticebox.routers`.
+        """
+        with measure('save', self, len(notices)):
+            shards = {}
+            for notice in notices:
+                shards.setdefault(shard_for_user(notice.user_id),
+                                  []).append(notice)
+            for alias, shard_notices in shards.items():
+                if self.deduplicate:
+                    self.deduplicate_notices(shard_notices, alias)
+                Notice.objects.db_manager(alias).bulk_create(shard_notices)
+        notices_created.send(sender=Notice, notices=notices)
+
+    def deduplicate_notices(self, notices, using=None):
         """
-        Notice.objects.bulk_create(notices)
+        Moves subjects and bodies of given notices to shared contents.
+        """
+        contents = NoticeContent.objects.db_manager(using).get_for_contents(
+            (notice.subject, notice.body) for notice in notices)
+        for notice in notices:
+            notice.content = contents[notice.subject, notice.body]
+            notice.subject = notice.body = ''
 
 
 class EmailHandler(BaseHandler):
     """
     Sends notices using email.
+
+    If `workers` is greater than one or `max_batch_size` is given then
+    messages are split to batches and sent in parallel by worker threads.
+    Connections are then taken from a pool and they are kept opened so that
+    they can be reused by subsequent calls (`close_connections` closes them).
+    A broken connection is replaced by a new one and the failed message is
+    sent again (if no connection can be opened then the rest of the batch
+    fails), recipients of messages which still failed are reported using
+    a `DeliveryError` exception.
+
+    If a `batch_size` is given then users are iterated lazily and messages
+    are rendered and sent in batches of the given size. A batch is sent
+    by a background thread while the next one is being rendered.
+
+    Messages are created by `create_message`. If a subclass does not
+    override it then messages are rendered by `render_all` and created by
+    `build_message`.
     """
 
     default_subject_template = 'noticebox/%(preset)s/email_subject.txt'
     default_body_template = 'noticebox/%(preset)s/email_body.txt'
+    default_batch_size = None
+    required_recipient_fields = ('email',)
 
     def __init__(self, backend=None, backend_options=None,
-                fail_silently=False, from_email=None, **kwargs):
+                fail_silently=False, from_email=None, workers=1,
+                max_batch_size=None, batch_size=None, **kwargs):
+        self.batch_size = batch_size or self.default_batch_size
         self.backend = backend
         self.backend_options = backend_options
         self.fail_silently = fail_silently
         self.from_email = from_email
+        self.workers = workers
+        self.max_batch_size = max_batch_size
+        self.pool = ConnectionPool(backend, **(backend_options or {}))
         super(EmailHandler, self).__init__(**kwargs)
 
-    def __call__(self, users, preset=None, fail_silently=None, **kwargs):
+    def __call__(self, users, preset=None, fail_silently=None,
+                 batch_size=None, _contexts=None, **kwargs):
         """
         Creates email messages with notice and sends them via email.
+
+        Template contexts created by `get_context` can be given as
+        `_contexts` (see `render_all`).
         """
         if fail_silently is None:
             fail_silently = self.fail_silently
-        messages = [self.create_message(user, preset, **kwargs)
-                    for user in _user_list(users) if user.email]
-        self.send_messages(messages, fail_silently=fail_silently)
+        if batch_size is None:
+            batch_size = self.batch_size
+        with measure('email_handler', self) as timer:
+            users = self.get_recipients(users, preset, batch_size)
+            recipients = (user for user in timer.count_items(users)
+                          if user.email)
+            if _overrides(self, EmailHandler, 'create_message'):
+                messages = (self.create_message(user, preset, **kwargs)
+                            for user in recipients)
+            else:
+                messages = (self.build_message(user, subject, body)
+                            for user, subject, body
+                            in self.render_all(recipients, preset, _contexts,
+                                               **kwargs))
+            if batch_size:
+                self.send_batches(_batches(messages, batch_size),
+                                  fail_silently=fail_silently)
+            else:
+                self.send_messages(list(messages),
+                                   fail_silently=fail_silently)
+
+    def bulk(self, items, fail_silently=None, batch_size=None, contexts=None):
+        """
+        Creates email messages for `(user, preset, kwargs)` items and sends
+        them.
+
+        Each user can get a message with a different preset and arguments.
+        Messages are sent in batches using a pool of connections created
+        for this call (and closed when it ends), so a single connection is
+        reused unless `workers` are configured.
+        """
+        if fail_silently is None:
+            fail_silently = self.fail_silently
+        if batch_size is None:
+            batch_size = self.batch_size
+        pool = ConnectionPool(self.backend, **(self.backend_options or {}))
+        try:
+            with measure('email_handler', self) as timer:
+                items = timer.count_items(items)
+                for batch, batch_contexts in _item_batches(items, contexts,
+                                                           batch_size):
+                    self._send_items(pool, batch, batch_contexts,
+                                     fail_silently)
+        finally:
+            pool.close()
+
+    def _send_items(self, pool, items, contexts, fail_silently):
+        recipients = [i for i, item in enumerate(items) if item[0].email]
+        if _overrides(self, EmailHandler, 'create_message'):
+            messages = [self.create_message(*items[i][:2], **items[i][2])
+                        for i in recipients]
+        else:
+            if contexts is not None:
+                contexts = [contexts[i] for i in recipients]
+            rendered = self.render_items([items[i] for i in recipients],
+                                         contexts)
+            messages = [self.build_message(user, subject, body)
+                        for user, subject, body in rendered]
+        self.send_messages(messages, fail_silently=fail_silently, pool=pool)
 
     def create_message(self, user, preset, **kwargs):
         """
         Creates and returns an email message for the given user.
         """
         subject, body = self.render(user, preset, **kwargs)
+        return self.build_message(user, subject, body)
+
+    def build_message(self, user, subject, body):
+        """
+        Returns an email message with already rendered subject and body.
+        """
         return EmailMessage(from_email=self.from_email, to=(user.email,),
                             subject=subject, body=body)
 
-    def send_messages(self, messages, fail_silently):
+    def send_messages(self, messages, fail_silently, connection=None,
+                      pool=None):
         """
-        Returns an email backend to be used for email sending.
+        Sends the given email messages.
+
+        An opened `connection` can be given, it is not closed then. It is
+        not used if messages are sent in parallel. If a connection `pool`
+        is given then messages are sent using connections of the pool
+        (instead of the pool of the handler), see `send_parallel`.
+        """
+        with measure('send', self, len(messages)):
+            if pool is not None or self.workers > 1 or self.max_batch_size:
+                try:
+                    send_parallel(pool or self.pool, messages,
+                                  workers=self.workers,
+                                  batch_size=self.max_batch_size)
+                except DeliveryError:
+                    if not fail_silently:
+                        raise
+                return
+            if connection is None:
+                connection = self.get_connection(fail_silently)
+            connection.send_messages(messages)
+
+    def get_connection(self, fail_silently):
+        """
+        Returns a connection of the configured email backend.
         """
         backend_options = self.backend_options or {}
-        connection = get_connection(self.backend, fail_silently=fail_silently,
-                                    **backend_options)
-        connection.send_messages(messages)
+        return get_connection(self.backend, fail_silently=fail_silently,
+                              **backend_options)
+
+    def send_batches(self, batches, fail_silently):
+        """
+        Sends batches of messages in a background thread.
+
+        The next batch is taken from the given iterable (and thus rendered)
+        while the previous one is being sent. The first error stops
+        the processing and it is raised again. Unless messages are sent
+        in parallel, all batches are sent using a single connection.
+        """
+        queue = Queue(maxsize=1)
+        errors = []
+        connection = None
+        if self.workers <= 1 and not self.max_batch_size:
+            connection = self.get_connection(fail_silently)
+            connection.open()
+
+        def sender():
+            while True:
+                batch = queue.get()
+                if batch is None:
+                    break
+                if not errors:
+                    try:
+                        self.send_messages(batch, fail_silently=fail_silently,
+                                           connection=connection)
+                    except Exception as e:
+                        errors.append(e)
+
+        thread = threading.Thread(target=sender)
+        thread.daemon = True
+        thread.start()
+        try:
+            for batch in batches:
+                if errors:
+                    break
+                queue.put(batch)
+        finally:
+            queue.put(None)
+            thread.join()
+            if connection is not None:
+                connection.close()
+        if errors:
+            raise errors[0]
+
+    def close_connections(self):
+        """
+        Closes connections kept opened for parallel sending.
+        """
+        self.pool.close()
 
 
 save_notice = DatabaseHandler()
 mail_notice = EmailHandler()
 
-def user_notice(users, preset=None, fail_silently=None, **kwargs):
+
+def _shares_contexts(*handlers):
+    """
+    Returns whether the given handlers create template contexts the same way.
+    """
+    methods = set(getattr(handler.get_context, '__func__', handler.get_context)
+                  for handler in handlers)
+    return len(methods) == 1
+
+
+def _create_contexts(handler, users, preset, kwargs):
+    """
+    Returns a dictionary mapping user ids to contexts of the handler.
+
+    Returns None if the preset is invariant (contexts are not needed).
+    """
+    if handler.is_invariant(preset or handler.preset):
+        return None
+    return dict((user.pk, handler.get_context(user, **kwargs))
+                for user in users)
+
+
+def user_notice(users, preset=None, fail_silently=None, batch_size=None,
+                **kwargs):
     """
     Saves notices in database and also sends them via email.
+
+    Users are iterated only once. A template context of each user is
+    created only once and used by both handlers unless they create contexts
+    differently (`get_context` is overridden), then each handler uses its
+    own contexts. If a `batch_size` is given then users are processed
+    in batches.
+    """
+    hints = _merge_hints(save_notice.get_recipient_hints(preset),
+                         mail_notice.get_recipient_hints(preset))
+    users = _user_iterator(users, batch_size, hints)
+    shared = _shares_contexts(save_notice, mail_notice)
+    for batch in _batches(users, batch_size):
+        save_contexts = _create_contexts(save_notice, batch, preset, kwargs)
+        if shared and save_contexts is not None:
+            mail_contexts = save_contexts
+        else:
+            mail_contexts = _create_contexts(mail_notice, batch, preset,
+                                             kwargs)
+        save_notice(batch, preset, _contexts=save_contexts, **kwargs)
+        mail_notice(batch, preset, fail_silently=fail_silently,
+                    _contexts=mail_contexts, **kwargs)
+
+
+def bulk_notice(items, fail_silently=None, batch_size=None):
+    """
+    Saves and sends notices for `(user, preset, kwargs)` items.
+
+    The `preset` of an item can be None (the default preset is used).
+    Items are rendered grouped by preset. A template context of each item
+    is created only once and used by both `save_notice` and `mail_notice`
+    unless they create contexts differently (`get_context` is overridden).
+    Emails are sent using connections opened for the call.
     """
-    save_notice(users, preset, **kwargs)
-    mail_notice(users, preset, fail_silently=fail_silently, **kwargs)
+    shared = _shares_contexts(save_notice, mail_notice)
+    for batch in _batches(items, batch_size):
+        contexts = None
+        if shared:
+            contexts = [None if save_notice.is_invariant(preset or
+                                                         save_notice.preset)
+                        else save_notice.get_context(user, **kwargs)
+                        for user, preset, kwargs in batch]
+        save_notice.bulk(batch, contexts=contexts)
+        mail_notice.bulk(batch, fail_silently=fail_silently,
+                         contexts=contexts)
@@ -0,0 +1,97 @@
+"""
+Timing of phases of the notice processing.
+
+Handlers, views and the context processor measure their phases using
+the `measure` class and the `phase_timed` signal is sent with results.
+Measuring is skipped if the signal has no receivers so that it costs
+(almost) nothing when it is not used. Following phases are measured:
+
+    `render`: rendering of a notice for a single user,
+    `save`: saving of a batch of notices to the database,
+    `send`: sending of a batch of email messages,
+    `database_handler`, `email_handler`: whole handler calls (the count is
+    the number of recipients),
+    `list_view`, `detail_view`, `mark_read_view`, `poll_view`: views
+    including rendering of template responses,
+    `count`: counting of unread notices by the context processor.
+"""
+
+import time
+
+from django.conf import settings
+from django.db import connections
+
+from noticebox.signals import phase_timed
+
+
+def _recorded_queries():
+    """
+    Returns the number of queries recorded by all database connections.
+
+    Queries of shard databases are thus included. Returns None if queries
+    are not recorded by any of the connections.
+    """
+    count = 0
+    for connection in connections.all():
+        if not (connection.use_debug_cursor or (
+                connection.use_debug_cursor is None and settings.DEBUG)):
+            return None
+        count += len(connection.queries)
+    return count
+
+
+class measure(object):
+    """
+    Measures a phase and sends the `phase_timed` signal when it ends.
+
+    Can be used as a context manager or stopped explicitly by calling
+    `stop`. The number of processed items can be given when the measuring
+    starts or stops.
+    """
+
+    def __init__(self, phase, sender=None, count=None):
+        self.phase = phase
+        self.sender = sender
+        self.count = count
+        self.active = bool(phase_timed.receivers)
+        if self.active:
+            self.queries = _recorded_queries()
+            self.start = time.time()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def count_items(self, iterable):
+        """
+        Returns the iterable, its items are counted if the phase is measured.
+        """
+        if not self.active:
+            return iterable
+        return self._count_items(iterable)
+
+    def _count_items(self, iterable):
+        self.count = 0
+        for item in iterable:
+            self.count += 1
+            yield item
+
+    def stop(self, count=None):
+        """
+        Sends the signal, does nothing if the phase was already stopped.
+        """
+        if not self.active:
+            return
+        self.active = False
+        duration = time.time() - self.start
+        if count is not None:
+            self.count = count
+        queries = None
+        if self.queries is not None:
+            end = _recorded_queries()
+            if end is not None:
+                queries = end - self.queries
+        phase_timed.send(sender=self.sender, phase=self.phase,
+                         duration=duration, count=self.count, queries=queries)
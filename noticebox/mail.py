@@ -0,0 +1,164 @@
+"""
+Email delivery helpers used by EmailHandler.
+
+A `ConnectionPool` keeps opened email backend connections so that they can
+be reused by subsequent calls and by multiple threads. The `send_parallel`
+function splits messages to batches and sends them using a thread pool,
+each thread uses its own connection from the pool.
+
+Messages of a batch are passed to the connection one by one. Backends
+such as the SMTP backend raise an exception at the first failing message
+without telling which messages were already sent, so only the failed
+message is sent again and nobody gets a duplicate email.
+"""
+
+import threading
+from multiprocessing.pool import ThreadPool
+
+from django.core.mail import get_connection
+
+
+class DeliveryError(IOError):
+    """
+    Raised when some email messages could not be sent.
+
+    The `failures` attribute is a list of `(recipient, exception)` tuples
+    for each recipient of a message which was not sent. The `recipients`
+    and `errors` attributes contain the same recipients and exceptions.
+    """
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.recipients = [recipient for recipient, error in failures]
+        self.errors = [error for recipient, error in failures]
+        messages = []
+        for error in self.errors:
+            if str(error) not in messages:
+                messages.append(str(error))
+        super(DeliveryError, self).__init__(
+            "Sending to %d recipient(s) failed: %s" % (
+                len(failures), '; '.join(messages)))
+
+
+class ConnectionPool(object):
+    """
+    Thread safe pool of email backend connections.
+
+    Connections are created on demand and they are kept opened until
+    the pool is closed. Connections are always created with
+    `fail_silently=False` so that errors can be detected.
+    """
+
+    def __init__(self, backend=None, **backend_options):
+        self.backend = backend
+        self.backend_options = backend_options
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Returns an opened connection which is not used by anyone else.
+        """
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        connection = get_connection(self.backend, fail_silently=False,
+                                    **self.backend_options)
+        connection.open()
+        return connection
+
+    def release(self, connection):
+        """
+        Returns the connection to the pool so that it can be reused.
+        """
+        with self._lock:
+            self._idle.append(connection)
+
+    def discard(self, connection):
+        """
+        Closes a broken connection instead of returning it to the pool.
+        """
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def close(self):
+        """
+        Closes all idle connections.
+        """
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            self.discard(connection)
+
+
+def _send_batch(pool, messages):
+    """
+    Sends messages one by one using a connection from the pool.
+
+    If sending of a message fails then the connection is replaced by a new
+    one and the message is sent again once. Messages which were already
+    sent are not sent again. If a connection cannot be opened then
+    the remaining messages are not attempted at all (so that an unreachable
+    server does not cost a connect timeout per message). Returns a list of
+    `(message, exception)` tuples of messages which could not be sent.
+    """
+    failed = []
+    connection = None
+    try:
+        for i, message in enumerate(messages):
+            for attempt in range(2):
+                if connection is None:
+                    try:
+                        connection = pool.acquire()
+                    except Exception as e:
+                        failed.extend((m, e) for m in messages[i:])
+                        return failed
+                try:
+                    connection.send_messages([message])
+                except Exception as e:
+                    pool.discard(connection)
+                    connection = None
+                    error = e
+                else:
+                    break
+            else:
+                failed.append((message, error))
+    finally:
+        if connection is not None:
+            pool.release(connection)
+    return failed
+
+
+def send_parallel(pool, messages, workers=1, batch_size=None):
+    """
+    Sends messages in batches using `workers` threads.
+
+    Raises DeliveryError after all batches are processed if any message
+    could not be sent.
+    """
+    messages = list(messages)
+    if not messages:
+        return
+    if not batch_size:
+        # Split messages evenly between the workers.
+        batch_size = (len(messages) + workers - 1) // workers
+    batches = [messages[i:i + batch_size]
+               for i in range(0, len(messages), batch_size)]
+    send = lambda batch: _send_batch(pool, batch)
+    if workers > 1 and len(batches) > 1:
+        thread_pool = ThreadPool(min(workers, len(batches)))
+        try:
+            results = thread_pool.map(send, batches)
+        finally:
+            thread_pool.close()
+            thread_pool.join()
+    else:
+        results = [send(batch) for batch in batches]
+    failures = [(recipient, error)
+                for failed in results
+                for message, error in failed
+                for recipient in message.recipients()]
+    if failures:
+        raise DeliveryError(failures)
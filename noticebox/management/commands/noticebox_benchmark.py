@@ -0,0 +1,44 @@
+from optparse import make_option
+
+from django.core.management.base import CommandError, NoArgsCommand
+
+from noticebox.benchmark import (
+    Benchmark, Result, ThrowawayEnvironment, peak_memory)
+
+
+class Command(NoArgsCommand):
+
+    help = ("Measures performance of notice handlers, views and the context "
+            "processor. Throwaway SQLite databases and cache are used.")
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('--users', type='int', default=100,
+                    help="Number of created users (recipients)."),
+        make_option('--notices', type='int', default=20,
+                    help="Number of notices created for each user."),
+        make_option('--repeat', type='int', default=10,
+                    help="Number of runs of each operation."),
+        make_option('--operations',
+                    help="Comma separated operations to be measured, "
+                         "one of: %s." % ', '.join(Benchmark.operations)),
+    )
+
+    def handle_noargs(self, **options):
+        operations = None
+        if options['operations']:
+            operations = options['operations'].split(',')
+            for name in operations:
+                if name not in Benchmark.operations:
+                    raise CommandError("Unknown operation: %s" % name)
+        benchmark = Benchmark(users=options['users'],
+                              notices=options['notices'],
+                              repeat=options['repeat'])
+        with ThrowawayEnvironment():
+            results = benchmark.run(operations)
+        if int(options['verbosity']) > 0:
+            self.stdout.write(Result.format_header())
+            for result in results:
+                self.stdout.write(result.format())
+            memory = peak_memory()
+            if memory is not None:
+                self.stdout.write("Peak memory of the process: %s" % memory)
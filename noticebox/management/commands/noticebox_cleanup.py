@@ -0,0 +1,35 @@
+
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+
+from noticebox.retention import RetentionPolicy
+
+
+class Command(NoArgsCommand):
+
+    help = "Deletes old notices according to the retention policy."
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('--read-days', dest='read_days', type='int',
+                    help="Delete read notices older than given days."),
+        make_option('--unread-days', dest='unread_days', type='int',
+                    help="Delete unread notices older than given days."),
+        make_option('--max-per-user', dest='max_per_user', type='int',
+                    help="Keep at most given number of notices per user."),
+        make_option('--batch-size', dest='batch_size', type='int',
+                    default=500, help="Number of notices deleted at once."),
+        make_option('--sleep', type='float', default=0,
+                    help="Seconds to sleep between deleted batches."),
+    )
+
+    def handle_noargs(self, **options):
+        policy = RetentionPolicy.from_settings(
+            read_days=options['read_days'],
+            unread_days=options['unread_days'],
+            max_per_user=options['max_per_user'],
+            batch_size=options['batch_size'],
+            sleep=options['sleep'])
+        deleted = policy.apply()
+        if int(options['verbosity']) > 0:
+            self.stdout.write("Deleted %d notice(s)." % deleted)
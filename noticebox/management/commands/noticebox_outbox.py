@@ -0,0 +1,30 @@
+
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+
+from noticebox.outbox import Worker
+
+
+class Command(NoArgsCommand):
+
+    help = "Delivers notices waiting in the outbox."
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('--concurrency', type='int', default=1,
+                    help="Number of jobs processed in parallel."),
+        make_option('--max-attempts', dest='max_attempts', type='int',
+                    default=5, help="Number of attempts before a job fails."),
+        make_option('--backoff', type='int', default=60,
+                    help="Seconds before the first retry of a failed job."),
+        make_option('--loop', action='store_true', default=False,
+                    help="Keep processing new jobs until interrupted."),
+        make_option('--interval', type='float', default=5,
+                    help="Seconds between outbox checks in the loop mode."),
+    )
+
+    def handle_noargs(self, **options):
+        worker = Worker(concurrency=options['concurrency'],
+                        max_attempts=options['max_attempts'],
+                        backoff=options['backoff'])
+        worker.run(loop=options['loop'], interval=options['interval'])
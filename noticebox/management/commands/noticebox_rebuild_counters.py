@@ -0,0 +1,15 @@
+
+from django.core.management.base import NoArgsCommand
+from django.db import transaction
+
+from noticebox.models import NoticeCounter
+
+
+class Command(NoArgsCommand):
+
+    help = ("Computes numbers of notices stored in the counter table again. "
+            "Should be run when no notices are being written.")
+
+    def handle_noargs(self, **options):
+        with transaction.commit_on_success():
+            NoticeCounter.objects.rebuild()
@@ -1,5 +1,12 @@
 
-from django.db import models
+import hashlib
+from datetime import datetime, timedelta
+
+from django.db import models, transaction
+from django.db.models import Count, F, Q
+
+from noticebox.routers import get_shards, shard_for_user
+from noticebox.signals import notices_read
 
 
 class NoticeManager(models.Manager):
@@ -7,5 +14,193 @@ class NoticeManager(models.Manager):
     def for_user(self, user):
         """
         Returns all notices for the given user.
+
+        The query is made in the database which contains user's notices,
+        see `noticebox.routers`.
+        """
+        queryset = self.get_query_set()
+        alias = shard_for_user(user)
+        if alias is not None:
+            queryset = queryset.using(alias)
+        return queryset.filter(user=user)
+
+    def list_for_user(self, user):
+        """
+        Returns notices for the given user without their bodies.
+
+        The queryset is suitable for notice lists which display only
+        subjects, bodies are loaded only if they are accessed.
+        """
+        return self.for_user(user).select_related('content') \
+            .defer('body', 'content__body')
+
+    def mark_read(self, user, pks=None, until=None):
+        """
+        Marks unread notices of the given user as read.
+
+        Only notices with given `pks` or notices created `until` the given
+        time are marked if these arguments are given. All notices are
+        updated using a single query, number of them is returned.
+        """
+        queryset = self.for_user(user).filter(atime=None)
+        if pks is not None:
+            queryset = queryset.filter(pk__in=pks)
+        if until is not None:
+            queryset = queryset.filter(ctime__lte=until)
+        count = queryset.update(atime=datetime.now())
+        if count:
+            notices_read.send(sender=self.model, user=user, count=count)
+        return count
+
+
+class NoticeContentManager(models.Manager):
+
+    def make_hash(self, subject, body):
+        """
+        Returns a hash identifying the given subject and body.
+        """
+        data = u'%s\0%s' % (subject, body)
+        return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+    def get_for_contents(self, contents):
+        """
+        Returns a dictionary mapping `(subject, body)` tuples to contents.
+
+        Existing contents are loaded using a single query, missing ones
+        are created.
+        """
+        hashes = dict((self.make_hash(subject, body), (subject, body))
+                      for subject, body in set(contents))
+        existing = self.get_query_set().filter(hash__in=list(hashes))
+        result = dict((hashes[c.hash], c) for c in existing)
+        for hash, (subject, body) in hashes.items():
+            if (subject, body) not in result:
+                result[subject, body] = self.get_query_set().get_or_create(
+                    hash=hash, defaults={'subject': subject, 'body': body})[0]
+        return result
+
+
+class NoticeCounterManager(models.Manager):
+
+    # Maximal number of users updated by a single query.
+    chunk_size = 500
+
+    def for_user(self, user):
+        """
+        Returns counter of the given user, missing counter is created.
+
+        A missing counter is created with zero counts first (or the one
+        created by a concurrent request is used), so that updates of counts
+        made in the meantime are not skipped. The counter is then locked
+        and the counted notices are stored in it.
+        """
+        try:
+            return self.get_query_set().get(user=user)
+        except self.model.DoesNotExist:
+            pass
+        self.get_or_create(user=user, defaults={'unread': 0, 'total': 0})
+        with transaction.commit_on_success(using=self.db):
+            counter = self.get_query_set().select_for_update().get(user=user)
+            totals, unread = self.count_notices([user.pk])
+            counter.unread = unread.get(user.pk, 0)
+            counter.total = totals.get(user.pk, 0)
+            self.get_query_set().filter(pk=counter.pk).update(
+                unread=counter.unread, total=counter.total)
+        return counter
+
+    def update_counts(self, user_ids, unread=0, total=0):
+        """
+        Adds given numbers to counters of the given users.
+
+        Counters are updated using atomic database updates. Missing counters
+        are not created, they are computed when they are needed.
+        """
+        user_ids = list(user_ids)
+        for i in range(0, len(user_ids), self.chunk_size):
+            self.get_query_set() \
+                .filter(user__in=user_ids[i:i + self.chunk_size]) \
+                .update(unread=F('unread') + unread, total=F('total') + total)
+
+    def count_notices(self, user_ids=None):
+        """
+        Returns dictionaries mapping user ids to total and unread counts.
+
+        Only notices of the given users are counted if `user_ids` is given.
+        """
+        from noticebox.models import Notice
+        totals = {}
+        unread = {}
+        for alias in get_shards():
+            notices = Notice.objects.using(alias)
+            if user_ids is not None:
+                notices = notices.filter(user__in=user_ids)
+            totals.update(notices.values_list('user').annotate(Count('pk')))
+            unread.update(notices.filter(atime=None)
+                          .values_list('user').annotate(Count('pk')))
+        return totals, unread
+
+    def rebuild(self, user_ids=None):
+        """
+        Computes counters of the given users (or of all users) again.
+
+        Existing counters are locked until the computed counts are stored
+        and they are updated in place. Notices created or read while
+        the counters are rebuilt may be counted twice (their updates of
+        counters wait for the lock and they are applied to counts which
+        already include them) or not at all (if their counter is missing),
+        so counters should be rebuilt when no notices are being written.
+        """
+        with transaction.commit_on_success(using=self.db):
+            counters = self.get_query_set()
+            if user_ids is not None:
+                user_ids = list(user_ids)
+                counters = counters.filter(user__in=user_ids)
+            existing = set(counters.select_for_update()
+                           .values_list('pk', flat=True))
+            totals, unread = self.count_notices(user_ids)
+            if user_ids is None:
+                user_ids = set(totals) | existing
+            # Counters with the same counts are updated by a single query.
+            updates = {}
+            for user_id in existing:
+                counts = (unread.get(user_id, 0), totals.get(user_id, 0))
+                updates.setdefault(counts, []).append(user_id)
+            for (unread_count, total_count), ids in updates.items():
+                for i in range(0, len(ids), self.chunk_size):
+                    self.get_query_set() \
+                        .filter(user__in=ids[i:i + self.chunk_size]) \
+                        .update(unread=unread_count, total=total_count)
+            self.bulk_create([
+                self.model(user_id=user_id, unread=unread.get(user_id, 0),
+                           total=totals.get(user_id, 0))
+                for user_id in user_ids if user_id not in existing])
+
+
+class OutboxJobManager(models.Manager):
+
+    def due(self, lock_timeout):
+        """
+        Returns jobs which should be processed now.
+
+        Jobs locked by other workers are excluded unless the lock is
+        older than `lock_timeout` seconds.
+        """
+        now = datetime.now()
+        expired = now - timedelta(seconds=lock_timeout)
+        return self.get_query_set().filter(
+            Q(locked=None) | Q(locked__lt=expired),
+            failed=False, next_attempt__lte=now).order_by('pk')
+
+    def claim(self, job):
+        """
+        Locks the given job, returns whether it succeeded.
+
+        Only one of concurrent workers can claim a job because the lock is
+        acquired using a conditional update.
         """
-        return self.get_query_set().filter(user=user)
+        now = datetime.now()
+        updated = self.get_query_set().filter(
+            pk=job.pk, locked=job.locked).update(locked=now)
+        if updated:
+            job.locked = now
+        return bool(updated)
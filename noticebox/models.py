@@ -5,21 +5,101 @@ from django.contrib.auth.models import User
 from django.core.urlresolvers import reverse
 from django.db import models
 
-from noticebox.managers import NoticeManager
+from noticebox.managers import (
+    NoticeManager, NoticeContentManager, NoticeCounterManager,
+    OutboxJobManager)
 
 
-class Notice(models.Model):
+class NoticeContent(models.Model):
+    """
+    Subject and body shared by multiple notices.
+
+    Contents are identified by a hash of the subject and the body so that
+    notices with the same content reference a single row.
+    """
 
-    user = models.ForeignKey(User)
+    hash = models.CharField(max_length=40, unique=True)
     subject = models.CharField(max_length=100)
     body = models.TextField()
-    ctime = models.DateTimeField(auto_now_add=True, editable=False)
+
+    objects = NoticeContentManager()
+
+    class Meta:
+        db_table = 'noticebox_noticecontent'
+
+    def __unicode__(self):
+        return self.subject
+
+
+class ContentDescriptor(object):
+    """
+    Returns a field of the notice content if the notice field is empty.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        value = instance.__dict__.get(self.name)
+        # The content_id may be deferred if a deferred field is loaded.
+        if not value and instance.content_id is not None:
+            return getattr(instance.content, self.name)
+        return value
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.name] = value
+
+
+class ContentFieldMixin(object):
+    """
+    Makes a notice field fall back to the field of the notice content.
+
+    The value stored in the notice row itself is saved to the database.
+    """
+
+    def contribute_to_class(self, cls, name):
+        super(ContentFieldMixin, self).contribute_to_class(cls, name)
+        setattr(cls, self.attname, ContentDescriptor(self.attname))
+
+    def pre_save(self, model_instance, add):
+        return model_instance.__dict__.get(self.attname)
+
+
+class ContentCharField(ContentFieldMixin, models.CharField):
+    pass
+
+
+class ContentTextField(ContentFieldMixin, models.TextField):
+    pass
+
+
+class Notice(models.Model):
+
+    # The user column is indexed by the composite indexes below.
+    user = models.ForeignKey(User, db_index=False)
+    # Subject and body are empty if the content is deduplicated.
+    subject = ContentCharField(max_length=100, blank=True)
+    body = ContentTextField(blank=True)
+    # Contents used by notices must not be deleted together with them.
+    content = models.ForeignKey(NoticeContent, null=True, blank=True,
+                                on_delete=models.PROTECT)
+    # Old notices are selected by the creation time for deletion.
+    ctime = models.DateTimeField(auto_now_add=True, editable=False,
+                                 db_index=True)
     atime = models.DateTimeField(null=True, blank=True, editable=False)
 
     objects = NoticeManager()
 
     class Meta:
         db_table = 'noticebox_notice'
+        index_together = [
+            # Notice list ordered by the creation time.
+            ('user', 'ctime'),
+            # Unread notices (atime is null) of a user.
+            ('user', 'atime'),
+        ]
 
     def __unicode__(self):
         return self.subject
@@ -33,3 +113,57 @@ class Notice(models.Model):
         self.atime = datetime.now() if value else None
     is_read = property(_get_is_read, _set_is_read)
     del _get_is_read, _set_is_read
+
+
+class NoticeCounter(models.Model):
+    """
+    Denormalized numbers of user's notices.
+
+    Counters are used only if the `NOTICEBOX_COUNTERS` setting is enabled.
+    """
+
+    user = models.OneToOneField(User, primary_key=True,
+                                related_name='notice_counter')
+    unread = models.IntegerField(default=0)
+    total = models.IntegerField(default=0)
+
+    objects = NoticeCounterManager()
+
+    class Meta:
+        db_table = 'noticebox_noticecounter'
+
+    def __unicode__(self):
+        return u'%s/%s' % (self.unread, self.total)
+
+
+class OutboxJob(models.Model):
+    """
+    A notice waiting in the outbox for deferred delivery.
+
+    The job references a handler by its import path and stores handler
+    arguments in the JSON format.
+    """
+
+    handler = models.CharField(max_length=255)
+    preset = models.CharField(max_length=100, blank=True)
+    kwargs = models.TextField()
+    user_ids = models.TextField()
+    ctime = models.DateTimeField(auto_now_add=True, editable=False)
+    next_attempt = models.DateTimeField(db_index=True)
+    attempts = models.PositiveIntegerField(default=0)
+    locked = models.DateTimeField(null=True, blank=True)
+    failed = models.BooleanField(default=False)
+    error = models.TextField(blank=True)
+
+    objects = OutboxJobManager()
+
+    class Meta:
+        db_table = 'noticebox_outboxjob'
+
+    def __unicode__(self):
+        return self.handler
+
+
+# Connect signal receivers.
+import noticebox.counters
+import noticebox.pubsub
@@ -0,0 +1,164 @@
+"""
+Deferred delivery of notices.
+
+Instead of rendering, saving and sending notices within the current request,
+the `defer_notice` handler stores a compact job in the outbox table. The job
+contains only the preset, keyword arguments (which must be JSON serializable)
+and ids of the users. Jobs are later processed by a `Worker`, usually
+started using the `noticebox_outbox` management command.
+
+Each job is delivered by one handler. By default `defer_notice` creates
+one job for `save_notice` and one for `mail_notice` so that a failure
+of email delivery does not cause duplicated notices in the database.
+"""
+
+import json
+import logging
+import time
+import traceback
+from datetime import datetime, timedelta
+from importlib import import_module
+from multiprocessing.pool import ThreadPool
+
+from django.contrib.auth.models import User
+from django.db import connections
+
+from noticebox.handlers import _batches, _user_list
+from noticebox.models import OutboxJob
+
+
+logger = logging.getLogger(__name__)
+
+
+def _user_ids(user_or_user_list):
+    users = _user_list(user_or_user_list)
+    if hasattr(users, 'values_list'):
+        return list(users.values_list('pk', flat=True))
+    return [user.pk for user in users]
+
+
+def _import_handler(path):
+    module_name, attr = path.rsplit('.', 1)
+    return getattr(import_module(module_name), attr)
+
+
+class OutboxHandler(object):
+    """
+    Stores notices in the outbox so that they are delivered later.
+    """
+
+    default_handlers = (
+        'noticebox.handlers.save_notice',
+        'noticebox.handlers.mail_notice',
+    )
+
+    def __init__(self, handlers=None):
+        self.handlers = handlers or self.default_handlers
+
+    def __call__(self, users, preset=None, **kwargs):
+        """
+        Creates outbox jobs for the given users.
+        """
+        user_ids = _user_ids(users)
+        if not user_ids:
+            return
+        now = datetime.now()
+        jobs = [OutboxJob(handler=handler, preset=preset or '',
+                          kwargs=json.dumps(kwargs),
+                          user_ids=json.dumps(user_ids), next_attempt=now)
+                for handler in self.handlers]
+        OutboxJob.objects.bulk_create(jobs)
+
+
+class Worker(object):
+    """
+    Processes jobs waiting in the outbox.
+
+    Failed jobs are retried after `backoff` seconds, the delay is doubled
+    after each failure. Jobs are marked as failed after `max_attempts`
+    attempts. Users of each job are loaded and passed to the handler
+    in chunks of `chunk_size`, if a chunk fails then only users which
+    were not processed yet are retried.
+    """
+
+    def __init__(self, concurrency=1, max_attempts=5, backoff=60,
+                 lock_timeout=3600, chunk_size=500):
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.lock_timeout = lock_timeout
+        self.chunk_size = chunk_size
+
+    def run(self, loop=False, interval=5):
+        """
+        Processes due jobs, optionally forever.
+        """
+        while True:
+            self.run_once()
+            if not loop:
+                break
+            time.sleep(interval)
+
+    def run_once(self):
+        """
+        Processes all jobs which are due, returns number of processed jobs.
+        """
+        jobs = list(OutboxJob.objects.due(self.lock_timeout))
+        if self.concurrency > 1 and len(jobs) > 1:
+            pool = ThreadPool(self.concurrency)
+            try:
+                results = pool.map(self._process_in_thread, jobs)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [self.process(job) for job in jobs]
+        return sum(results)
+
+    def _process_in_thread(self, job):
+        try:
+            return self.process(job)
+        finally:
+            for connection in connections.all():
+                connection.close()
+
+    def process(self, job):
+        """
+        Delivers the given job, returns whether it was processed.
+        """
+        if not OutboxJob.objects.claim(job):
+            return False
+        user_ids = json.loads(job.user_ids)
+        done = 0
+        try:
+            handler = _import_handler(job.handler)
+            kwargs = dict((str(key), value)
+                          for key, value in json.loads(job.kwargs).items())
+            for chunk in _batches(user_ids, self.chunk_size):
+                users = User.objects.filter(pk__in=chunk).order_by('pk')
+                handler(users, job.preset or None, **kwargs)
+                done += len(chunk)
+        except Exception:
+            logger.exception("Delivery of outbox job %s failed.", job.pk)
+            self.retry(job, user_ids[done:], traceback.format_exc())
+        else:
+            job.delete()
+        return True
+
+    def retry(self, job, user_ids, error):
+        """
+        Schedules next attempt of a failed job.
+        """
+        job.attempts += 1
+        job.user_ids = json.dumps(user_ids)
+        job.error = error
+        job.locked = None
+        if job.attempts >= self.max_attempts:
+            job.failed = True
+        else:
+            delay = self.backoff * 2 ** (job.attempts - 1)
+            job.next_attempt = datetime.now() + timedelta(seconds=delay)
+        job.save()
+
+
+defer_notice = OutboxHandler()
@@ -0,0 +1,116 @@
+"""
+Keyset (cursor) pagination of notices.
+
+Notices are ordered from the newest ones and a page is identified by
+the creation time and id of the notice preceding it. Unlike the offset
+pagination, the cost of a page does not depend on its position and the total
+number of notices is never counted.
+"""
+
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+
+CURSOR_FORMAT = '%Y%m%d%H%M%S%f'
+
+
+class InvalidCursor(ValueError):
+    """
+    Raised when a cursor cannot be decoded.
+    """
+
+
+def encode_cursor(notice):
+    """
+    Returns a cursor pointing to the given notice.
+    """
+    ctime = notice.ctime
+    if timezone.is_aware(ctime):
+        ctime = timezone.make_naive(ctime, timezone.utc)
+    return '%s.%d' % (ctime.strftime(CURSOR_FORMAT), notice.pk)
+
+
+def decode_cursor(cursor):
+    """
+    Returns creation time and id of the notice the cursor points to.
+    """
+    try:
+        ctime, pk = cursor.split('.')
+        ctime = datetime.strptime(ctime, CURSOR_FORMAT)
+        pk = int(pk)
+    except (AttributeError, ValueError):
+        raise InvalidCursor("Invalid cursor: %r" % (cursor,))
+    if settings.USE_TZ:
+        ctime = timezone.make_aware(ctime, timezone.utc)
+    return ctime, pk
+
+
+class CursorPage(object):
+    """
+    A page of notices returned by the CursorPaginator.
+    """
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator(object):
+    """
+    Paginates notices from the newest ones using cursors.
+    """
+
+    def __init__(self, queryset, per_page):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+
+    def page(self, after=None, before=None):
+        """
+        Returns a page of notices older than `after` or newer than `before`.
+
+        The first page is returned if no cursor is given.
+        """
+        queryset = self.queryset
+        if before:
+            ctime, pk = decode_cursor(before)
+            queryset = queryset.filter(
+                Q(ctime__gt=ctime) | Q(ctime=ctime, pk__gt=pk))
+            notices = list(queryset.order_by('ctime', 'pk')[:self.per_page + 1])
+            has_previous = len(notices) > self.per_page
+            notices = notices[:self.per_page]
+            notices.reverse()
+            has_next = True
+        else:
+            if after:
+                ctime, pk = decode_cursor(after)
+                queryset = queryset.filter(
+                    Q(ctime__lt=ctime) | Q(ctime=ctime, pk__lt=pk))
+            notices = list(queryset.order_by('-ctime', '-pk')[:self.per_page + 1])
+            has_next = len(notices) > self.per_page
+            notices = notices[:self.per_page]
+            has_previous = bool(after)
+        next_cursor = previous_cursor = None
+        if notices and has_next:
+            next_cursor = encode_cursor(notices[-1])
+        if notices and has_previous:
+            previous_cursor = encode_cursor(notices[0])
+        return CursorPage(notices, next_cursor, previous_cursor)
@@ -0,0 +1,160 @@
+"""
+Publishing of new notices to waiting clients.
+
+If the `NOTICEBOX_BROKER` setting contains an import path of a broker class
+then a message is published to each user whose notices were created by
+`DatabaseHandler`. The `NoticeStreamView` subscribes to the messages so that
+waiting clients (using long polling or server-sent events) are woken up
+immediately without polling the database.
+
+The `LocMemBroker` delivers messages only within the current process, it is
+suitable for tests and single process servers. Other backends (for example
+based on Redis) can be implemented by subclassing `BaseBroker`.
+"""
+
+import threading
+from collections import defaultdict
+from importlib import import_module
+
+from django.conf import settings
+from django.dispatch import receiver
+
+from noticebox.signals import notices_created
+
+
+class BaseSubscription(object):
+    """
+    Messages published to a user, returned by `BaseBroker.subscribe`.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get(self, timeout=None):
+        """
+        Returns a list of received messages.
+
+        Waits at most `timeout` seconds for a message, an empty list is
+        returned if no message was received.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """
+        Stops receiving of messages.
+        """
+        raise NotImplementedError
+
+
+class BaseBroker(object):
+    """
+    Publishes messages to subscribed users.
+    """
+
+    def publish(self, user_ids, message):
+        """
+        Publishes the message (a dictionary) to given users.
+        """
+        raise NotImplementedError
+
+    def subscribe(self, user_id):
+        """
+        Returns a subscription of messages published to the given user.
+        """
+        raise NotImplementedError
+
+
+class LocMemSubscription(BaseSubscription):
+
+    def __init__(self, broker, user_id):
+        self.broker = broker
+        self.user_id = user_id
+        self.messages = []
+        self.condition = threading.Condition()
+
+    def put(self, message):
+        with self.condition:
+            self.messages.append(message)
+            self.condition.notify()
+
+    def get(self, timeout=None):
+        with self.condition:
+            if not self.messages:
+                self.condition.wait(timeout)
+            messages, self.messages = self.messages, []
+        return messages
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocMemBroker(BaseBroker):
+    """
+    Delivers messages to subscribers in the current process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+
+    def publish(self, user_ids, message):
+        with self._lock:
+            subscriptions = [subscription
+                             for user_id in user_ids
+                             for subscription in self._subscriptions.get(
+                                 user_id, ())]
+        for subscription in subscriptions:
+            subscription.put(message)
+
+    def subscribe(self, user_id):
+        subscription = LocMemSubscription(self, user_id)
+        with self._lock:
+            self._subscriptions[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.user_id]
+
+
+_brokers = {}
+_brokers_lock = threading.Lock()
+
+
+def get_broker():
+    """
+    Returns the broker configured by `NOTICEBOX_BROKER` or None.
+
+    A single broker instance is shared by the whole process.
+    """
+    path = getattr(settings, 'NOTICEBOX_BROKER', None)
+    if not path:
+        return None
+    with _brokers_lock:
+        if path not in _brokers:
+            module_name, attr = path.rsplit('.', 1)
+            _brokers[path] = getattr(import_module(module_name), attr)()
+        return _brokers[path]
+
+
+@receiver(notices_created, dispatch_uid='noticebox.pubsub.notices_created')
+def publish_created(sender, notices, **kwargs):
+    broker = get_broker()
+    if broker is None:
+        return
+    counts = defaultdict(int)
+    for notice in notices:
+        counts[notice.user_id] += 1
+    # Group users by counts so that only few messages are published.
+    users_by_counts = defaultdict(list)
+    for user_id, count in counts.items():
+        users_by_counts[count].append(user_id)
+    for count, user_ids in users_by_counts.items():
+        broker.publish(user_ids, {'created': count})
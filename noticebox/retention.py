@@ -0,0 +1,170 @@
+"""
+Deletion of old notices.
+
+The `RetentionPolicy` deletes read notices and unread notices older than
+the given number of days and notices exceeding the maximal number of notices
+per user. Notices are deleted in small batches selected using the index of
+creation times so that the table is never locked for a long time, the policy
+can sleep between batches to limit the load of the database. Notices are
+deleted from all databases if they are sharded (see `noticebox.routers`).
+Shared contents which are not referenced by any notice anymore are deleted
+as well.
+
+The policy is usually applied by the `noticebox_cleanup` management
+command, defaults are taken from `NOTICEBOX_KEEP_READ_DAYS`,
+`NOTICEBOX_KEEP_UNREAD_DAYS` and `NOTICEBOX_MAX_NOTICES_PER_USER` settings.
+Subclasses can override the `archive` method to store notices elsewhere
+before they are deleted.
+"""
+
+import time
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db.models import Count, ProtectedError, Q
+
+from noticebox.models import Notice, NoticeContent
+from noticebox.routers import get_shards
+from noticebox.signals import notices_deleted
+
+
+class RetentionPolicy(object):
+    """
+    Deletes old notices in batches.
+    """
+
+    def __init__(self, read_days=None, unread_days=None, max_per_user=None,
+                 batch_size=500, sleep=0):
+        self.read_days = read_days
+        self.unread_days = unread_days
+        self.max_per_user = max_per_user
+        self.batch_size = batch_size
+        self.sleep = sleep
+
+    @classmethod
+    def from_settings(cls, **kwargs):
+        """
+        Returns a policy configured by settings, kwargs take precedence.
+        """
+        options = {
+            'read_days': getattr(settings, 'NOTICEBOX_KEEP_READ_DAYS', None),
+            'unread_days': getattr(settings, 'NOTICEBOX_KEEP_UNREAD_DAYS',
+                                   None),
+            'max_per_user': getattr(settings, 'NOTICEBOX_MAX_NOTICES_PER_USER',
+                                    None),
+        }
+        options.update((k, v) for k, v in kwargs.items() if v is not None)
+        return cls(**options)
+
+    def apply(self):
+        """
+        Deletes all notices which should not be kept, returns their number.
+        """
+        deleted = 0
+        now = datetime.now()
+        for alias in get_shards():
+            notices = Notice.objects.using(alias)
+            if self.read_days is not None:
+                deleted += self.delete(notices.filter(
+                    atime__isnull=False,
+                    ctime__lt=now - timedelta(days=self.read_days)))
+            if self.unread_days is not None:
+                deleted += self.delete(notices.filter(
+                    atime=None,
+                    ctime__lt=now - timedelta(days=self.unread_days)))
+            if self.max_per_user is not None:
+                deleted += self.trim(notices)
+            self.delete_contents(NoticeContent.objects.using(alias))
+        return deleted
+
+    def trim(self, queryset):
+        """
+        Deletes oldest notices of users who have too many of them.
+        """
+        deleted = 0
+        counts = queryset.values_list('user').annotate(count=Count('pk'))
+        for user_id, count in counts.filter(count__gt=self.max_per_user):
+            notices = queryset.filter(user=user_id)
+            # Creation time and id of the newest notice to be deleted.
+            ordered = notices.order_by('-ctime', '-pk')
+            ctime, pk = ordered.values_list('ctime', 'pk')[self.max_per_user]
+            deleted += self.delete(notices.filter(
+                Q(ctime__lt=ctime) | Q(ctime=ctime, pk__lte=pk)))
+        return deleted
+
+    def delete(self, queryset):
+        """
+        Deletes notices in the given queryset in batches.
+
+        Batches are ordered by creation times and each of them continues
+        after the last notice of the previous batch, so notices which are
+        kept are not scanned again.
+        """
+        deleted = 0
+        queryset = queryset.order_by('ctime', 'pk') \
+            .only('pk', 'user', 'ctime', 'atime')
+        last = None
+        while True:
+            batch = queryset
+            if last is not None:
+                batch = batch.filter(Q(ctime__gt=last.ctime) |
+                                     Q(ctime=last.ctime, pk__gt=last.pk))
+            notices = list(batch[:self.batch_size])
+            if not notices:
+                break
+            last = notices[-1]
+            pks = [notice.pk for notice in notices]
+            self.archive(Notice.objects.using(queryset.db).filter(pk__in=pks))
+            self.delete_notices(notices, queryset.db)
+            notices_deleted.send(sender=Notice, notices=notices)
+            deleted += len(notices)
+            if len(notices) < self.batch_size:
+                break
+            if self.sleep:
+                time.sleep(self.sleep)
+        return deleted
+
+    def delete_notices(self, notices, using):
+        """
+        Deletes the given notices.
+
+        Unread notices are deleted only if they are still unread. Notices
+        which were read in the meantime are deleted separately and their
+        `atime` is updated, so that receivers of `notices_deleted` do not
+        count them as unread.
+        """
+        manager = Notice.objects.using(using)
+        unread = dict((notice.pk, notice) for notice in notices
+                      if notice.atime is None)
+        if unread:
+            manager.filter(pk__in=list(unread), atime=None).delete()
+            for pk, atime in manager.filter(pk__in=list(unread)) \
+                    .values_list('pk', 'atime'):
+                unread[pk].atime = atime
+        read = [notice.pk for notice in notices if notice.atime is not None]
+        if read:
+            manager.filter(pk__in=read).delete()
+
+    def delete_contents(self, queryset):
+        """
+        Deletes contents which are not used by any notice in batches.
+        """
+        queryset = queryset.filter(notice=None).order_by('pk')
+        while True:
+            pks = list(queryset.values_list('pk', flat=True)[:self.batch_size])
+            if not pks:
+                break
+            try:
+                NoticeContent.objects.using(queryset.db) \
+                    .filter(pk__in=pks, notice=None).delete()
+            except ProtectedError:
+                # Some contents were used again in the meantime, they are
+                # not selected by the next query.
+                pass
+
+    def archive(self, queryset):
+        """
+        Called with notices which are going to be deleted.
+
+        Does nothing by default.
+        """
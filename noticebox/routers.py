@@ -0,0 +1,98 @@
+"""
+Storage of notices in multiple databases.
+
+If the `NOTICEBOX_SHARDS` setting contains a list of database aliases then
+notices of each user are stored in one of these databases, the database is
+selected by the user id. Notices are routed by `NoticeManager.for_user` (and
+thus by the views and the context processor), by `DatabaseHandler` and by
+the retention policy. Shared notice contents are stored together with
+the notices. Other models of the application (such as counters or
+the outbox) are stored in the default database.
+
+The `NoticeRouter` should be added to the `DATABASE_ROUTERS` setting so that
+notices are saved to the right database and users of notices are loaded
+from their own database.
+
+Django does not support foreign keys across databases. The router does not
+allow the users table to be created in shards (other than the database of
+users) so that `syncdb` does not create a foreign key constraint of notices
+referencing an empty copy of the users table.
+"""
+
+from django.conf import settings
+from django.db import router
+
+
+def get_shards():
+    """
+    Returns aliases of all databases containing notices.
+    """
+    shards = getattr(settings, 'NOTICEBOX_SHARDS', None)
+    if shards:
+        return list(shards)
+    from noticebox.models import Notice
+    return [router.db_for_write(Notice)]
+
+
+def shard_for_user(user_or_id):
+    """
+    Returns alias of the database containing notices of the given user.
+
+    Returns None if notices are not sharded.
+    """
+    shards = getattr(settings, 'NOTICEBOX_SHARDS', None)
+    if not shards:
+        return None
+    user_id = getattr(user_or_id, 'pk', user_or_id)
+    return shards[int(user_id) % len(shards)]
+
+
+def _is_sharded(model):
+    from noticebox.models import Notice, NoticeContent
+    return issubclass(model, (Notice, NoticeContent))
+
+
+def _is_user_model(model):
+    from noticebox.models import Notice
+    return issubclass(model, Notice._meta.get_field('user').rel.to)
+
+
+def _is_notice(instance):
+    from noticebox.models import Notice
+    return isinstance(instance, Notice)
+
+
+class NoticeRouter(object):
+    """
+    Routes notices to databases of their users.
+    """
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is None or not _is_notice(instance):
+            return None
+        if _is_sharded(model):
+            return shard_for_user(instance.user_id)
+        # A related object (the user) of a notice.
+        return router.db_for_read(model)
+
+    def db_for_write(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is None or not _is_notice(instance):
+            return None
+        if _is_sharded(model):
+            return shard_for_user(instance.user_id)
+        return router.db_for_write(model)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if _is_sharded(type(obj1)) or _is_sharded(type(obj2)):
+            return True
+        return None
+
+    def allow_syncdb(self, db, model):
+        if _is_sharded(model):
+            return db in get_shards()
+        if _is_user_model(model) and db in get_shards():
+            # Notices in other shards must not reference the users table.
+            return db == router.db_for_write(model)
+        return None
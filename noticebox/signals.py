@@ -0,0 +1,24 @@
+"""
+Signals sent by the noticebox application.
+"""
+
+from django.dispatch import Signal
+
+
+# Sent after notices were saved in the database by DatabaseHandler.
+notices_created = Signal(providing_args=['notices'])
+
+# Sent after `count` unread notices of the `user` were marked as read.
+notices_read = Signal(providing_args=['user', 'count'])
+
+# Sent after notices were deleted by the retention policy. The `notices`
+# list contains instances with loaded `user_id` and `atime` fields only.
+notices_deleted = Signal(providing_args=['notices'])
+
+# Sent after a `phase` (such as rendering or saving of notices) took
+# `duration` seconds and processed `count` items (notices, messages or
+# users). The number of database `queries` (summed over all databases) is
+# given only if queries are recorded by all connections (if `DEBUG` is
+# enabled), otherwise it is None. The signal is not sent if there are no
+# receivers, see `noticebox.instrumentation`.
+phase_timed = Signal(providing_args=['phase', 'duration', 'count', 'queries'])
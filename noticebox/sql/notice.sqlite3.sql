@@ -0,0 +1,3 @@
+-- Partial index of unread notices, it is smaller than the (user_id, atime)
+-- index and it is used for counting of unread notices.
+CREATE INDEX noticebox_notice_unread ON noticebox_notice (user_id) WHERE atime IS NULL;
@@ -1,6 +1,15 @@
 
 # Import test cases here so that they are discovered by Django test runner.
+from noticebox.tests.test_benchmark import *
 from noticebox.tests.test_context_processors import *
+from noticebox.tests.test_counters import *
 from noticebox.tests.test_handlers import *
+from noticebox.tests.test_instrumentation import *
+from noticebox.tests.test_models import *
+from noticebox.tests.test_outbox import *
+from noticebox.tests.test_pagination import *
+from noticebox.tests.test_pubsub import *
+from noticebox.tests.test_retention import *
+from noticebox.tests.test_routers import *
 from noticebox.tests.test_simple import *
 from noticebox.tests.test_views import *
@@ -22,10 +22,17 @@ DATABASES = {
         'ENGINE' : 'django.db.backends.sqlite3',
         'NAME' : '',
     },
+    # Used for testing of sharded notices.
+    'shard': {
+        'ENGINE' : 'django.db.backends.sqlite3',
+        'NAME' : '',
+    },
 }
 
 ROOT_URLCONF = 'noticebox.urls'
 
+SECRET_KEY = 'noticebox-tests'
+
 DEFAULT_FROM_EMAIL = 'admin@example.com'
 
 # Do not slow down test execution.
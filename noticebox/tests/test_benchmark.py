@@ -0,0 +1,66 @@
+
+from django.contrib.auth.models import User
+from django.core.cache import get_cache
+from django.core.management import call_command
+from django.db import connections
+from django.test.utils import override_settings
+from django.utils.six import StringIO
+
+from noticebox.benchmark import Benchmark, ThrowawayEnvironment
+from noticebox.models import Notice
+from noticebox.tests.base import BaseNoticeTestCase
+
+
+__all__ = ('BenchmarkTestCase',)
+
+
+class BenchmarkTestCase(BaseNoticeTestCase):
+    """
+    Tests that the benchmarks can be run.
+    """
+
+    def test_run(self):
+        benchmark = Benchmark(users=3, notices=2, repeat=2)
+        results = benchmark.run()
+        self.assertEqual(list(Benchmark.operations),
+                         [result.name for result in results])
+        for result in results:
+            self.assertEqual(2, len(result.timings))
+            self.assertTrue(result.p50 <= result.p99)
+        save_result = results[0]
+        self.assertEqual(3, save_result.notices)
+        # Notices are saved using a single insert.
+        self.assertEqual([1, 1], save_result.queries)
+        self.assertEqual(3 * 2 + 3 * 2 + 3 * 2, Notice.objects.count())
+
+    def test_unknown_operation(self):
+        benchmark = Benchmark(users=1, notices=1, repeat=1)
+        self.assertRaises(ValueError, benchmark.run, ['unknown'])
+
+    def test_management_command(self):
+        stdout = StringIO()
+        call_command('noticebox_benchmark', users=2, notices=1, repeat=1,
+                     operations='save_notice,list_view', stdout=stdout)
+        lines = stdout.getvalue().splitlines()
+        self.assertEqual(4, len(lines))
+        self.assertTrue(lines[1].startswith('save_notice'))
+        self.assertTrue(lines[2].startswith('list_view'))
+        self.assertTrue(lines[3].startswith('Peak memory of the process'))
+        # Nothing was created in the test database.
+        self.assertEqual(0, Notice.objects.count())
+
+    @override_settings(NOTICEBOX_CACHE='default')
+    def test_throwaway_environment(self):
+        user = User.objects.create(username='existing')
+        cache = get_cache('default')
+        cache.set('noticebox:modified:%s' % user.pk, 'kept')
+        databases = connections.databases
+        with ThrowawayEnvironment():
+            self.assertNotEqual(databases, connections.databases)
+            self.assertFalse(User.objects.exists())
+            Benchmark(users=2, notices=1, repeat=1).run(['save_notice'])
+            self.assertTrue(Notice.objects.exists())
+        self.assertEqual(databases, connections.databases)
+        self.assertEqual([user], list(User.objects.all()))
+        self.assertEqual(0, Notice.objects.count())
+        self.assertEqual('kept', cache.get('noticebox:modified:%s' % user.pk))
@@ -1,13 +1,18 @@
 
+from datetime import datetime
+
 from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.template import Template
 from django.template.context import RequestContext
 from django.test.client import RequestFactory
 
+from noticebox.handlers import save_notice
 from noticebox.models import Notice
 from noticebox.tests.base import BaseNoticeTestCase
 
 
-__all__ = ('NoticesContextPreprocessorTestCase',)
+__all__ = ('NoticesContextPreprocessorTestCase', 'CachedUnreadCountTestCase')
 
 
 class NoticesContextPreprocessorTestCase(BaseNoticeTestCase):
@@ -54,3 +59,115 @@ class NoticesContextPreprocessorTestCase(BaseNoticeTestCase):
             value = context['notice_unread_count']
             self.assertEqual(1, value())
             self.assertEqual(1, value())
+
+    def test_value_is_memoized_on_request(self):
+        request = RequestFactory().get('/')
+        request.user = self.user
+        with self.assertNumQueries(1):
+            self.assertEqual(1, RequestContext(request)['notice_unread_count']())
+            self.assertEqual(1, RequestContext(request)['notice_unread_count']())
+
+    def test_memo_follows_user_of_request(self):
+        other = self.create_user('bob')
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        self.assertFalse('notice_unread_count' in RequestContext(request))
+        # The user logs in, for example by login() in the view.
+        request.user = self.user
+        self.assertEqual(1, RequestContext(request)['notice_unread_count']())
+        request.user = other
+        self.assertEqual(0, RequestContext(request)['notice_unread_count']())
+        # The user logs out.
+        request.user = AnonymousUser()
+        self.assertFalse('notice_unread_count' in RequestContext(request))
+
+    def test_context_is_not_shared(self):
+        request = RequestFactory().get('/')
+        request.user = self.user
+        context = RequestContext(request)
+        context['notice_unread_count'] = None
+        self.assertNotEqual(None, RequestContext(request)['notice_unread_count'])
+
+    def test_unread_list(self):
+        for i in range(6):
+            Notice.objects.create(user=self.user, subject=str(i))
+        Notice.objects.filter(subject='5').update(atime=datetime.now())
+        Notice.objects.create(user=self.create_user('bob'), subject='bob')
+        request = RequestFactory().get('/')
+        request.user = self.user
+        context = RequestContext(request)
+        with self.assertNumQueries(1):
+            self.assertEqual(['4', '3', '2', '1', '0'],
+                             [n.subject for n in context['notice_unread_list']])
+            self.assertEqual(6, context['notice_unread_count']())
+
+    def test_unread_list_and_count_share_query(self):
+        request = RequestFactory().get('/')
+        request.user = self.user
+        template = Template('{{ notice_unread_count }}:'
+                            '{% for n in notice_unread_list %}{{ n }}{% endfor %}')
+        with self.assertNumQueries(1):
+            self.assertEqual('1:Hello', template.render(RequestContext(request)))
+
+    def test_empty_unread_list(self):
+        Notice.objects.update(atime=datetime.now())
+        request = RequestFactory().get('/')
+        request.user = self.user
+        context = RequestContext(request)
+        self.assertEqual([], list(context['notice_unread_list']))
+        self.assertEqual(0, context['notice_unread_count']())
+
+    def test_unread_list_size(self):
+        Notice.objects.create(user=self.user, subject='Hello again')
+        request = RequestFactory().get('/')
+        request.user = self.user
+        with self.settings(NOTICEBOX_UNREAD_LIST_SIZE=1):
+            context = RequestContext(request)
+        self.assertEqual(1, len(context['notice_unread_list']))
+        self.assertEqual(2, context['notice_unread_count']())
+
+
+class CachedUnreadCountTestCase(BaseNoticeTestCase):
+    """
+    Tests the `notices` context preprocessor with the cache enabled.
+    """
+
+    urls = 'noticebox.tests.urls'
+
+    def __call__(self, *args, **kwargs):
+        with self.settings(NOTICEBOX_CACHE='default'):
+            super(CachedUnreadCountTestCase, self).__call__(*args, **kwargs)
+
+    def setUp(self):
+        cache.clear()
+        self.user = self.create_user()
+        self.notice = Notice.objects.create(
+            user=self.user, subject='Hello', body='')
+
+    def get_count(self):
+        request = RequestFactory().get('/')
+        request.user = self.user
+        return RequestContext(request)['notice_unread_count']()
+
+    def test_count_is_cached(self):
+        self.assertEqual(1, self.get_count())
+        with self.assertNumQueries(0):
+            self.assertEqual(1, self.get_count())
+
+    def test_count_is_incremented(self):
+        self.assertEqual(1, self.get_count())
+        save_notice(self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(2, self.get_count())
+
+    def test_count_is_decremented(self):
+        self.assertEqual(1, self.get_count())
+        self.client.login(username='alice', password='alice')
+        self.client.get('/notices/%d/' % self.notice.pk)
+        self.client.get('/notices/%d/' % self.notice.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(0, self.get_count())
+
+    def test_count_is_not_created_by_increment(self):
+        save_notice(self.user)
+        self.assertEqual(2, self.get_count())
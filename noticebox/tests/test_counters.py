@@ -0,0 +1,104 @@
+
+from django.core.management import call_command
+
+from noticebox.counters import count_unread
+from noticebox.handlers import save_notice
+from noticebox.models import Notice, NoticeCounter
+from noticebox.tests.base import BaseNoticeTestCase
+
+
+__all__ = ('NoticeCounterTestCase',)
+
+
+class NoticeCounterTestCase(BaseNoticeTestCase):
+    """
+    Tests the `NoticeCounter` table.
+    """
+
+    urls = 'noticebox.tests.urls'
+
+    def __call__(self, *args, **kwargs):
+        with self.settings(NOTICEBOX_COUNTERS=True):
+            super(NoticeCounterTestCase, self).__call__(*args, **kwargs)
+
+    def setUp(self):
+        self.user = self.create_user()
+        self.notice = Notice.objects.create(
+            user=self.user, subject='Hello', body='')
+
+    def get_counter(self):
+        return NoticeCounter.objects.get(user=self.user)
+
+    def test_counter_is_created_when_needed(self):
+        self.assertEqual(1, count_unread(self.user))
+        self.assertEqual(1, self.get_counter().total)
+
+    def test_counter_created_concurrently(self):
+        get_or_create = NoticeCounter.objects.get_or_create
+        def concurrent_get_or_create(**kwargs):
+            # Another request creates the counter in the meantime.
+            NoticeCounter.objects.create(user=self.user, unread=42, total=42)
+            return get_or_create(**kwargs)
+        NoticeCounter.objects.get_or_create = concurrent_get_or_create
+        try:
+            # The existing counter is used and its counts are computed.
+            self.assertEqual(1, count_unread(self.user))
+        finally:
+            del NoticeCounter.objects.get_or_create
+        self.assertEqual(1, NoticeCounter.objects.count())
+
+    def test_notice_created_while_counting(self):
+        count_notices = NoticeCounter.objects.count_notices
+        def concurrent_count_notices(user_ids):
+            # The counter exists, so the update of the signal is not lost.
+            self.assertEqual(0, self.get_counter().total)
+            save_notice(self.user)
+            self.assertEqual(1, self.get_counter().total)
+            return count_notices(user_ids)
+        NoticeCounter.objects.count_notices = concurrent_count_notices
+        try:
+            self.assertEqual(2, count_unread(self.user))
+        finally:
+            del NoticeCounter.objects.count_notices
+        self.assertEqual(2, self.get_counter().total)
+
+    def test_count_is_taken_from_counter(self):
+        count_unread(self.user)
+        NoticeCounter.objects.update(unread=42)
+        with self.assertNumQueries(1):
+            self.assertEqual(42, count_unread(self.user))
+
+    def test_counter_is_incremented(self):
+        count_unread(self.user)
+        save_notice([self.user, self.create_user('bob')])
+        counter = self.get_counter()
+        self.assertEqual(2, counter.unread)
+        self.assertEqual(2, counter.total)
+
+    def test_counter_is_decremented(self):
+        count_unread(self.user)
+        self.client.login(username='alice', password='alice')
+        self.client.get('/notices/%d/' % self.notice.pk)
+        self.client.get('/notices/%d/' % self.notice.pk)
+        counter = self.get_counter()
+        self.assertEqual(0, counter.unread)
+        self.assertEqual(1, counter.total)
+
+    def test_rebuild(self):
+        count_unread(self.user)
+        NoticeCounter.objects.update(unread=42, total=42)
+        Notice.objects.create(user=self.user, subject='Hello', body='')
+        self.notice.is_read = True
+        self.notice.save()
+        call_command('noticebox_rebuild_counters')
+        counter = self.get_counter()
+        self.assertEqual(1, counter.unread)
+        self.assertEqual(2, counter.total)
+
+    def test_rebuild_creates_missing_and_resets_empty_counters(self):
+        bob = self.create_user('bob')
+        NoticeCounter.objects.create(user=bob, unread=42, total=42)
+        NoticeCounter.objects.rebuild()
+        self.assertEqual(1, self.get_counter().unread)
+        self.assertEqual((0, 0), NoticeCounter.objects.filter(user=bob)
+                         .values_list('unread', 'total').get())
@@ -1,13 +1,25 @@
 
+from django.contrib.auth.models import Group, User
+from django.core.mail import EmailMessage
+from django.db.models import ProtectedError
 from django.core.mail.backends.locmem import EmailBackend as LocMemEmailBackend
 
-from noticebox.handlers import EmailHandler, DatabaseHandler, user_notice
-from noticebox.models import Notice
+from noticebox.handlers import (
+    EmailHandler, DatabaseHandler, bulk_notice, mail_notice, save_notice,
+    user_notice)
+from noticebox.mail import DeliveryError
+from noticebox.models import Notice, NoticeContent
 from noticebox.tests.base import BaseNoticeTestCase
 
 
 __all__ = ('DatabaseHandlerTestCase', 'EmailHandlerTestCase',
-           'UserNoticeShortcutTestCase')
+           'UserNoticeShortcutTestCase', 'RecipientHintsTestCase',
+           'BulkNoticeTestCase')
+
+
+GROUPS_HINTS = {
+    'groups': {'only': ['username'], 'prefetch_related': ['groups']},
+}
 
 
 class DatabaseHandlerTestCase(BaseNoticeTestCase):
@@ -15,8 +27,8 @@ class DatabaseHandlerTestCase(BaseNoticeTestCase):
     Tests the `DatabaseHandler` class.
     """
 
-    def create_handler(self, **kwargs):
-        return DatabaseHandler(**kwargs)
+    def create_handler(self, cls=DatabaseHandler, **kwargs):
+        return cls(**kwargs)
 
     def test_notice_to_empty_list(self):
         handler = self.create_handler()
@@ -91,6 +103,159 @@ class DatabaseHandlerTestCase(BaseNoticeTestCase):
         handler([self.create_user()], subject='', body='<script>')
         self.assertEqual('<p>&lt;script&gt;</p>', Notice.objects.get().body)
 
+    def test_notices_are_saved_at_once_by_default(self):
+        handler = self.create_handler(cls=BatchRecordingDatabaseHandler)
+        handler([self.create_user('alice'), self.create_user('bob')])
+        self.assertEqual([2], handler.batches)
+
+    def test_notices_are_saved_in_batches(self):
+        handler = self.create_handler(cls=BatchRecordingDatabaseHandler,
+                                      batch_size=2)
+        for username in ('alice', 'bob', 'cecil'):
+            self.create_user(username)
+        handler(User.objects.all())
+        self.assertEqual([2, 1], handler.batches)
+        self.assertEqual(3, Notice.objects.count())
+
+    def test_batch_size_single(self):
+        handler = self.create_handler(cls=BatchRecordingDatabaseHandler)
+        for username in ('alice', 'bob', 'cecil'):
+            self.create_user(username)
+        handler(User.objects.all(), batch_size=1)
+        self.assertEqual([1, 1, 1], handler.batches)
+        self.assertEqual(3, Notice.objects.count())
+
+    def test_invariant_preset_is_rendered_once(self):
+        handler = self.create_handler(cls=RenderCountingDatabaseHandler,
+                                      invariant_presets=['default'])
+        handler([self.create_user('alice'), self.create_user('bob')],
+                subject='Test subject', body='Test body')
+        self.assertEqual(1, handler.render_count)
+        self.assertEqual(['Test subject', 'Test subject'],
+                         [n.subject for n in Notice.objects.all()])
+
+    def test_variant_preset_is_rendered_for_each_user(self):
+        handler = self.create_handler(cls=RenderCountingDatabaseHandler,
+                                      invariant_presets=['default'])
+        handler([self.create_user('alice'), self.create_user('bob')],
+                preset='hello')
+        self.assertEqual(2, handler.render_count)
+
+    def test_invariant_preset_is_rendered_without_user(self):
+        handler = self.create_handler(invariant_presets=['hello'])
+        handler([self.create_user()], preset='hello')
+        self.assertEqual('Hello None!',  Notice.objects.get().subject)
+
+    def test_templates_are_cached(self):
+        handler = self.create_handler()
+        self.assertTrue(handler.get_body_template(None, 'hello')
+                        is handler.get_body_template(None, 'hello'))
+
+    def test_template_cache_can_be_cleared(self):
+        handler = self.create_handler()
+        template = handler.get_body_template(None, 'hello')
+        handler.clear_template_cache()
+        self.assertFalse(template is handler.get_body_template(None, 'hello'))
+
+    def test_template_cache_can_be_disabled(self):
+        handler = self.create_handler(cache_templates=False)
+        self.assertFalse(handler.get_body_template(None, 'hello')
+                         is handler.get_body_template(None, 'hello'))
+
+    def test_templates_are_not_cached_in_debug_mode(self):
+        handler = self.create_handler()
+        with self.settings(DEBUG=True):
+            self.assertFalse(handler.get_body_template(None, 'hello')
+                             is handler.get_body_template(None, 'hello'))
+
+    def test_parallel_rendering_in_threads(self):
+        handler = self.create_handler(render_workers=2, render_pool='thread')
+        handler.render_chunk_size = 2
+        users = [self.create_user('user%d' % i) for i in range(5)]
+        handler(users, preset='hello')
+        self.assertEqual(['Hello user%d!' % i for i in range(5)],
+                         [n.subject for n in Notice.objects.order_by('pk')])
+
+    def test_parallel_rendering_in_processes(self):
+        handler = self.create_handler(ProcessRenderingDatabaseHandler,
+                                      render_workers=2)
+        handler.render_chunk_size = 2
+        users = [self.create_user('user%d' % i) for i in range(5)]
+        handler(users, preset='hello')
+        self.assertEqual(['Hello process%d!' % u.pk for u in users],
+                         [n.subject for n in Notice.objects.order_by('pk')])
+
+    def test_custom_create_notice(self):
+        handler = self.create_handler(CustomDatabaseHandler)
+        handler([self.create_user('alice'), self.create_user('bob')],
+                preset='hello')
+        self.assertEqual(['Custom alice', 'Custom bob'],
+                         [n.subject for n in Notice.objects.order_by('pk')])
+
+    def test_custom_create_notice_in_batches(self):
+        handler = self.create_handler(CustomDatabaseHandler, batch_size=1)
+        handler([self.create_user('alice'), self.create_user('bob')])
+        self.assertEqual(['Custom alice', 'Custom bob'],
+                         [n.subject for n in Notice.objects.order_by('pk')])
+
+    def test_parallel_rendering_loads_users(self):
+        handler = self.create_handler(render_workers=2)
+        handler.render_chunk_size = 2
+        users = [self.create_user('user%d' % i) for i in range(5)]
+        handler(users, preset='hello')
+        self.assertEqual(['Hello user%d!' % i for i in range(5)],
+                         [n.subject for n in Notice.objects.order_by('pk')])
+
+    def test_parallel_rendering_of_missing_users(self):
+        handler = self.create_handler(MissingUsersDatabaseHandler,
+                                      render_workers=2)
+        users = [self.create_user(u) for u in ('alice', 'bob', 'cecil')]
+        handler(users, preset='hello')
+        self.assertEqual(['Hello alice!', 'Hello bob!', 'Hello cecil!'],
+                         [n.subject for n in Notice.objects.order_by('pk')])
+
+    def test_invalid_render_pool(self):
+        self.assertRaises(ValueError, self.create_handler, render_pool='gpu')
+
+    def test_deduplicated_content(self):
+        handler = self.create_handler(deduplicate=True)
+        handler([self.create_user('alice'), self.create_user('bob')],
+                subject='Test subject', body='Test body')
+        handler(self.create_user('cecil'),
+                subject='Test subject', body='Test body')
+        content = NoticeContent.objects.get()
+        self.assertEqual(3, content.notice_set.count())
+        self.assertEqual([''], list(Notice.objects.values_list('body', flat=True)
+                                    .distinct()))
+        for notice in Notice.objects.all():
+            self.assertEqual('Test subject', notice.subject)
+            self.assertEqual('<p>Test body</p>', notice.body)
+
+    def test_deduplicated_content_differs(self):
+        handler = self.create_handler(deduplicate=True)
+        handler([self.create_user('alice'), self.create_user('bob')],
+                preset='hello')
+        self.assertEqual(['Hello alice!', 'Hello bob!'],
+                         sorted(c.subject for c in NoticeContent.objects.all()))
+        self.assertEqual(['Hello alice!', 'Hello bob!'],
+                         sorted(n.subject for n in Notice.objects.all()))
+
+    def test_deduplicated_notice_list(self):
+        handler = self.create_handler(deduplicate=True)
+        user = self.create_user()
+        handler(user, subject='Test subject', body='Test body')
+        with self.assertNumQueries(1):
+            notice = Notice.objects.list_for_user(user).get()
+            self.assertEqual('Test subject', notice.subject)
+        # The deferred body is loaded from the content.
+        self.assertEqual('<p>Test body</p>', notice.body)
+
+    def test_deduplicated_content_is_protected(self):
+        handler = self.create_handler(deduplicate=True)
+        handler(self.create_user(), subject='Test subject', body='Test body')
+        self.assertRaises(ProtectedError, NoticeContent.objects.all().delete)
+        self.assertEqual(1, Notice.objects.count())
+
 
 class EmailHandlerTestCase(BaseNoticeTestCase):
     """
@@ -197,6 +362,136 @@ class EmailHandlerTestCase(BaseNoticeTestCase):
         handler([self.create_user(email='')], subject='Test subject', body='Test body')
         self.assertEqual(0,  len(self.mail_outbox))
 
+    def test_custom_create_message(self):
+        handler = CustomEmailHandler()
+        handler([self.create_user('alice'), self.create_user('bob')],
+                preset='hello', batch_size=1)
+        self.assertEqual(['Custom alice', 'Custom bob'],
+                         [m.subject for m in self.mail_outbox])
+
+    def test_invariant_preset(self):
+        handler = self.create_handler(invariant_presets=['default'])
+        handler([self.create_user('alice'), self.create_user('bob')],
+                subject='Test subject', body='Test body')
+        self.assertEqual(['Test body', 'Test body'],
+                         [m.body for m in self.mail_outbox])
+        self.assertEqual([['alice@example.com'], ['bob@example.com']],
+                         [m.to for m in self.mail_outbox])
+
+    def test_parallel_rendering(self):
+        handler = self.create_handler(render_workers=2, render_pool='thread')
+        handler.render_chunk_size = 1
+        handler([self.create_user('alice'), self.create_user('bob'),
+                 self.create_user('cecil')], preset='hello')
+        self.assertEqual(['Hello alice!', 'Hello bob!', 'Hello cecil!'],
+                         [m.subject for m in self.mail_outbox])
+
+    def test_sending_in_batches(self):
+        backend = 'noticebox.tests.test_handlers.CountingEmailBackend'
+        handler = self.create_handler(backend=backend, batch_size=2)
+        CountingEmailBackend.batches = []
+        for username in ('alice', 'bob', 'cecil'):
+            self.create_user(username)
+        handler(User.objects.order_by('pk'))
+        self.assertEqual([2, 1], CountingEmailBackend.batches)
+        self.assertEqual(['alice@example.com', 'bob@example.com',
+                          'cecil@example.com'],
+                         [m.to[0] for m in self.mail_outbox])
+
+    def test_sending_in_batches_uses_one_connection(self):
+        backend = 'noticebox.tests.test_handlers.CountingEmailBackend'
+        handler = self.create_handler(backend=backend, batch_size=1)
+        CountingEmailBackend.opened = CountingEmailBackend.closed = 0
+        CountingEmailBackend.batches = []
+        handler([self.create_user(u) for u in ('alice', 'bob', 'cecil')])
+        self.assertEqual([1, 1, 1], CountingEmailBackend.batches)
+        self.assertEqual(1, CountingEmailBackend.opened)
+        self.assertEqual(1, CountingEmailBackend.closed)
+
+    def test_sending_in_batches_fails(self):
+        backend = 'noticebox.tests.test_handlers.BrokenEmailBackend'
+        handler = self.create_handler(backend=backend, batch_size=1)
+        with self.assertRaises(IOError):
+            handler([self.create_user('alice'), self.create_user('bob')])
+        self.assertEqual(0, len(self.mail_outbox))
+
+    def test_sending_in_batches_fail_silently(self):
+        backend = 'noticebox.tests.test_handlers.BrokenEmailBackend'
+        handler = self.create_handler(backend=backend, batch_size=1)
+        handler([self.create_user('alice'), self.create_user('bob')],
+                fail_silently=True)
+        self.assertEqual(0, len(self.mail_outbox))
+
+    def test_parallel_sending(self):
+        handler = self.create_handler(workers=2)
+        handler([self.create_user(u) for u in ('alice', 'bob', 'cecil')])
+        self.assertEqual(['alice@example.com', 'bob@example.com',
+                          'cecil@example.com'],
+                         sorted(m.to[0] for m in self.mail_outbox))
+
+    def test_parallel_sending_in_batches(self):
+        backend = 'noticebox.tests.test_handlers.CountingEmailBackend'
+        handler = self.create_handler(backend=backend, workers=2,
+                                      max_batch_size=1)
+        CountingEmailBackend.batches = []
+        handler([self.create_user(u) for u in ('alice', 'bob', 'cecil')])
+        self.assertEqual([1, 1, 1], CountingEmailBackend.batches)
+        self.assertEqual(3, len(self.mail_outbox))
+
+    def test_parallel_sending_reuses_connections(self):
+        backend = 'noticebox.tests.test_handlers.CountingEmailBackend'
+        handler = self.create_handler(backend=backend, max_batch_size=1)
+        CountingEmailBackend.opened = 0
+        handler([self.create_user('alice'), self.create_user('bob')])
+        handler([self.create_user('cecil')])
+        self.assertEqual(1, CountingEmailBackend.opened)
+        handler.close_connections()
+
+    def test_parallel_sending_reconnects(self):
+        backend = 'noticebox.tests.test_handlers.FlakyEmailBackend'
+        handler = self.create_handler(backend=backend, workers=2)
+        FlakyEmailBackend.failures = 1
+        handler([self.create_user('alice')])
+        self.assertEqual(1, len(self.mail_outbox))
+
+    def test_parallel_sending_reports_failed_recipients(self):
+        backend = 'noticebox.tests.test_handlers.BrokenEmailBackend'
+        handler = self.create_handler(backend=backend, workers=2)
+        with self.assertRaises(DeliveryError) as cm:
+            handler([self.create_user('alice'), self.create_user('bob')])
+        self.assertEqual(['alice@example.com', 'bob@example.com'],
+                         sorted(cm.exception.recipients))
+
+    def test_parallel_sending_does_not_repeat_sent_messages(self):
+        backend = 'noticebox.tests.test_handlers.RejectingEmailBackend'
+        handler = self.create_handler(backend=backend, max_batch_size=3)
+        with self.assertRaises(DeliveryError) as cm:
+            handler([self.create_user(u) for u in ('alice', 'bob', 'cecil')])
+        self.assertEqual(['alice@example.com', 'cecil@example.com'],
+                         [m.to[0] for m in self.mail_outbox])
+        self.assertEqual(['bob@example.com'], cm.exception.recipients)
+        self.assertEqual([('bob@example.com', cm.exception.errors[0])],
+                         cm.exception.failures)
+        handler.close_connections()
+
+    def test_parallel_sending_stops_if_server_is_unreachable(self):
+        backend = 'noticebox.tests.test_handlers.UnreachableEmailBackend'
+        handler = self.create_handler(backend=backend, workers=2)
+        UnreachableEmailBackend.opened = 0
+        users = [self.create_user('user%d' % i) for i in range(10)]
+        with self.assertRaises(DeliveryError) as cm:
+            handler(users)
+        self.assertEqual(10, len(cm.exception.recipients))
+        # A single connection attempt per worker.
+        self.assertEqual(2, UnreachableEmailBackend.opened)
+
+    def test_parallel_sending_fail_silently(self):
+        backend = 'noticebox.tests.test_handlers.BrokenEmailBackend'
+        handler = self.create_handler(backend=backend, workers=2,
+                                      fail_silently=True)
+        handler([self.create_user('alice'), self.create_user('bob')])
+        self.assertEqual(0, len(self.mail_outbox))
+
 
 class UserNoticeShortcutTestCase(BaseNoticeTestCase):
     """
@@ -218,6 +513,334 @@ class UserNoticeShortcutTestCase(BaseNoticeTestCase):
         self.assertEqual(2, Notice.objects.count())
         self.assertEqual(2, len(self.mail_outbox))
 
+    def test_users_are_loaded_once(self):
+        self.create_user('alice')
+        self.create_user('bob')
+        # Users are selected once, notices are inserted at once.
+        with self.assertNumQueries(2):
+            user_notice(User.objects.all(), preset='hello')
+        self.assertEqual(['Hello alice!', 'Hello bob!'],
+                         sorted(n.subject for n in Notice.objects.all()))
+        self.assertEqual(['Hello alice!', 'Hello bob!'],
+                         sorted(m.subject for m in self.mail_outbox))
+
+    def test_contexts_are_shared(self):
+        calls = []
+        def get_context(user, **kwargs):
+            calls.append(user)
+            return DatabaseHandler.get_context(save_notice, user, **kwargs)
+        save_notice.get_context = mail_notice.get_context = get_context
+        try:
+            user_notice([self.create_user('alice'), self.create_user('bob')])
+        finally:
+            del save_notice.get_context, mail_notice.get_context
+        self.assertEqual(2, len(calls))
+        self.assertEqual(2, len(self.mail_outbox))
+
+    def test_contexts_of_handlers(self):
+        def get_context(user, **kwargs):
+            kwargs['context'] = 'Mail'
+            return EmailHandler.get_context(mail_notice, user, **kwargs)
+        mail_notice.get_context = get_context
+        try:
+            user_notice(self.create_user('alice'), preset='context',
+                        context='Web', contexts='notice')
+        finally:
+            del mail_notice.get_context
+        self.assertEqual('Web notice', Notice.objects.get().subject)
+        self.assertEqual('Mail notice', self.mail_outbox[0].subject)
+
+    def test_context_kwargs(self):
+        user_notice(self.create_user('alice'), preset='context',
+                    context='Foo', contexts='Bar')
+        self.assertEqual('Foo Bar', Notice.objects.get().subject)
+        self.assertEqual('Foo Bar', self.mail_outbox[0].subject)
+
+    def test_handle_in_batches(self):
+        for username in ('alice', 'bob', 'cecil'):
+            self.create_user(username)
+        user_notice(User.objects.all(), batch_size=2)
+        self.assertEqual(3, Notice.objects.count())
+        self.assertEqual(3, len(self.mail_outbox))
+
+
+class RecipientHintsTestCase(BaseNoticeTestCase):
+    """
+    Tests loading of recipients using recipient hints.
+    """
+
+    def setUp(self):
+        self.group = Group.objects.create(name='staff')
+
+    def create_users(self, count):
+        for i in range(count):
+            self.create_user('user%d' % i).groups.add(self.group)
+        return User.objects.all()
+
+    def test_query_count_is_constant(self):
+        handler = DatabaseHandler(recipient_hints=GROUPS_HINTS)
+        # Users, their groups and the insert of notices.
+        users = self.create_users(5)
+        with self.assertNumQueries(3):
+            handler(users, preset='groups')
+        self.assertEqual(['<p>staff </p>'] * 5,
+                         [n.body for n in Notice.objects.all()])
+
+    def test_query_count_without_hints(self):
+        handler = DatabaseHandler()
+        users = self.create_users(5)
+        with self.assertNumQueries(7):
+            handler(users, preset='groups')
+
+    def test_email_is_always_loaded(self):
+        handler = EmailHandler(recipient_hints=GROUPS_HINTS)
+        users = self.create_users(5)
+        with self.assertNumQueries(2):
+            handler(users, preset='groups')
+        self.assertEqual(['staff '] * 5, [m.body for m in self.mail_outbox])
+
+    def test_chunked_loading(self):
+        handler = BatchRecordingDatabaseHandler(recipient_hints=GROUPS_HINTS)
+        users = self.create_users(5)
+        # Two queries (users and groups) and an insert for each chunk.
+        with self.assertNumQueries(9):
+            handler(users, preset='groups', batch_size=2)
+        self.assertEqual([2, 2, 1], handler.batches)
+        self.assertEqual(['Groups of user%d' % i for i in range(5)],
+                         [n.subject for n in Notice.objects.order_by('pk')])
+
+    def test_chunked_loading_keeps_ordering(self):
+        handler = BatchRecordingDatabaseHandler(recipient_hints=GROUPS_HINTS)
+        users = self.create_users(5).order_by('-username')
+        handler(users, preset='groups', batch_size=2)
+        self.assertEqual(['Groups of user%d' % i for i in reversed(range(5))],
+                         [n.subject for n in Notice.objects.order_by('pk')])
+
+    def test_chunked_loading_by_offsets(self):
+        handler = BatchRecordingDatabaseHandler()
+        # Users cannot be selected after a value of the related field.
+        users = self.create_users(5).order_by('groups__name', '-username')
+        with self.assertNumQueries(6):
+            handler(users, preset='hello', batch_size=2)
+        self.assertEqual([2, 2, 1], handler.batches)
+        self.assertEqual(['Hello user%d!' % i for i in reversed(range(5))],
+                         [n.subject for n in Notice.objects.order_by('pk')])
+
+    def test_user_notice(self):
+        hints = save_notice.recipient_hints
+        save_notice.recipient_hints = mail_notice.recipient_hints = GROUPS_HINTS
+        users = self.create_users(5)
+        try:
+            with self.assertNumQueries(3):
+                user_notice(users, preset='groups')
+        finally:
+            save_notice.recipient_hints = mail_notice.recipient_hints = hints
+        self.assertEqual(5, len(self.mail_outbox))
+
+
+class BulkNoticeTestCase(BaseNoticeTestCase):
+    """
+    Tests submission of notices with different presets and arguments.
+    """
+
+    def get_items(self):
+        return [
+            (self.create_user('alice'), 'hello', {}),
+            (self.create_user('bob'), None, {'subject': 'Invoice',
+                                             'body': 'Total: 10'}),
+            (self.create_user('cecil', email=''), None, {'subject': 'Invoice',
+                                                         'body': 'Total: 20'}),
+        ]
+
+    def test_database_handler(self):
+        handler = BatchRecordingDatabaseHandler()
+        items = self.get_items()
+        with self.assertNumQueries(1):
+            handler.bulk(items)
+        self.assertEqual([3], handler.batches)
+        self.assertEqual(
+            ['<p>Hello alice, how are you?</p>', '<p>Total: 10</p>',
+             '<p>Total: 20</p>'],
+            [n.body for n in Notice.objects.order_by('user__username')])
+
+    def test_database_handler_in_batches(self):
+        handler = BatchRecordingDatabaseHandler()
+        handler.bulk(self.get_items(), batch_size=2)
+        self.assertEqual([2, 1], handler.batches)
+
+    def test_email_handler(self):
+        backend = 'noticebox.tests.test_handlers.CountingEmailBackend'
+        handler = EmailHandler(backend=backend)
+        CountingEmailBackend.opened = 0
+        CountingEmailBackend.closed = 0
+        CountingEmailBackend.batches = []
+        items = self.get_items()
+        handler.bulk(items)
+        handler.bulk(items[:1])
+        # Each call opens one connection and closes it.
+        self.assertEqual(2, CountingEmailBackend.opened)
+        self.assertEqual(2, CountingEmailBackend.closed)
+        self.assertEqual(3, len(CountingEmailBackend.batches))
+        self.assertEqual(['Hello alice, how are you?', 'Total: 10',
+                          'Hello alice, how are you?'],
+                         [m.body for m in self.mail_outbox])
+        self.assertEqual([['alice@example.com'], ['bob@example.com'],
+                          ['alice@example.com']],
+                         [m.to for m in self.mail_outbox])
+
+    def test_email_handler_in_batches(self):
+        backend = 'noticebox.tests.test_handlers.CountingEmailBackend'
+        handler = EmailHandler(backend=backend)
+        CountingEmailBackend.opened = 0
+        CountingEmailBackend.closed = 0
+        CountingEmailBackend.batches = []
+        items = self.get_items()
+        items.append((self.create_user('dave'), 'hello', {}))
+        handler.bulk(items, batch_size=2)
+        self.assertEqual(1, CountingEmailBackend.opened)
+        self.assertEqual(1, CountingEmailBackend.closed)
+        self.assertEqual(['alice@example.com', 'bob@example.com',
+                          'dave@example.com'],
+                         [m.to[0] for m in self.mail_outbox])
+
+    def test_items_are_grouped_by_preset(self):
+        handler = RenderCountingDatabaseHandler(invariant_presets=['hello'])
+        users = [self.create_user(name) for name in ('alice', 'bob', 'cecil')]
+        items = [(users[0], 'hello', {}),
+                 (users[1], None, {'subject': 'Invoice', 'body': 'Total'}),
+                 (users[2], 'hello', {})]
+        rendered = list(handler.render_items(items))
+        self.assertEqual([users[0], users[2], users[1]],
+                         [user for user, subject, body in rendered])
+        self.assertEqual(['Hello None!', 'Hello None!', 'Invoice'],
+                         [subject for user, subject, body in rendered])
+        # The invariant preset was rendered once for both its items.
+        self.assertEqual(2, handler.render_count)
+
+    def test_bulk_uses_send_messages(self):
+        handler = RecordingEmailHandler()
+        items = self.get_items()
+        handler(items[0][0], subject='Hello', body='')
+        handler.bulk(items)
+        self.assertEqual([['alice@example.com'],
+                          ['alice@example.com', 'bob@example.com']],
+                         handler.sent)
+        self.assertEqual(3, len(self.mail_outbox))
+
+    def test_custom_handlers(self):
+        items = self.get_items()
+        CustomDatabaseHandler().bulk(items)
+        CustomEmailHandler().bulk(items)
+        self.assertEqual(['Custom alice', 'Custom bob', 'Custom cecil'],
+                         [n.subject for n in Notice.objects.order_by('pk')])
+        self.assertEqual(['Custom alice', 'Custom bob'],
+                         [m.subject for m in self.mail_outbox])
+
+    def test_email_handler_fail_silently(self):
+        handler = EmailHandler(
+            backend='noticebox.tests.test_handlers.BrokenEmailBackend')
+        items = self.get_items()
+        self.assertRaises(DeliveryError, handler.bulk, items)
+        handler.bulk(items, fail_silently=True)
+
+    def test_bulk_notice(self):
+        items = self.get_items()
+        with self.assertNumQueries(1):
+            bulk_notice(items)
+        self.assertEqual(3, Notice.objects.count())
+        self.assertEqual(['Hello alice!', 'Invoice'],
+                         [m.subject for m in self.mail_outbox])
+
+    def test_bulk_notice_in_batches(self):
+        bulk_notice(self.get_items(), batch_size=1)
+        self.assertEqual(3, Notice.objects.count())
+        self.assertEqual(2, len(self.mail_outbox))
+
+
+class RecordingEmailHandler(EmailHandler):
+    """
+    Email handler which remembers recipients of sent messages.
+    """
+
+    def __init__(self, **kwargs):
+        self.sent = []
+        super(RecordingEmailHandler, self).__init__(**kwargs)
+
+    def send_messages(self, messages, *args, **kwargs):
+        self.sent.append([m.to[0] for m in messages])
+        super(RecordingEmailHandler, self).send_messages(
+            messages, *args, **kwargs)
+
+
+class BatchRecordingDatabaseHandler(DatabaseHandler):
+    """
+    Database handler which remembers sizes of saved batches.
+    """
+
+    def __init__(self, **kwargs):
+        self.batches = []
+        super(BatchRecordingDatabaseHandler, self).__init__(**kwargs)
+
+    def save_notices(self, notices):
+        self.batches.append(len(notices))
+        super(BatchRecordingDatabaseHandler, self).save_notices(notices)
+
+
+class RenderCountingDatabaseHandler(DatabaseHandler):
+    """
+    Database handler which counts rendered notices.
+    """
+
+    render_count = 0
+
+    def render(self, *args, **kwargs):
+        self.render_count += 1
+        return super(RenderCountingDatabaseHandler, self).render(*args, **kwargs)
+
+
+class ProcessRenderingDatabaseHandler(DatabaseHandler):
+    """
+    Does not load users in rendering processes.
+
+    The in-memory test database cannot be used by other processes.
+    """
+
+    def get_users(self, user_ids, preset=None):
+        return [User(pk=pk, username='process%d' % pk) for pk in user_ids]
+
+
+class CustomDatabaseHandler(DatabaseHandler):
+    """
+    Database handler which creates notices without templates.
+    """
+
+    def create_notice(self, user, preset, **kwargs):
+        return Notice(user=user, subject='Custom %s' % user.username)
+
+
+class CustomEmailHandler(EmailHandler):
+    """
+    Email handler which creates messages without templates.
+    """
+
+    def create_message(self, user, preset, **kwargs):
+        return EmailMessage(subject='Custom %s' % user.username,
+                            to=(user.email,))
+
+
+class MissingUsersDatabaseHandler(DatabaseHandler):
+    """
+    Does not find bob in rendering processes.
+
+    A rendering process uses a copy of the in-memory test database, users
+    deleted from the copy still exist in the parent process.
+    """
+
+    def get_users(self, user_ids, preset=None):
+        User.objects.filter(username='bob').delete()
+        return super(MissingUsersDatabaseHandler, self).get_users(
+            user_ids, preset)
+
 
 class BrokenEmailBackend(LocMemEmailBackend):
     """
@@ -229,3 +852,65 @@ class BrokenEmailBackend(LocMemEmailBackend):
             pass
         else:
             raise IOError("This email backend is broken")
+
+
+class CountingEmailBackend(LocMemEmailBackend):
+    """
+    Fake email backend which counts opened connections and sent batches.
+    """
+
+    opened = 0
+    closed = 0
+    batches = []
+
+    def open(self):
+        CountingEmailBackend.opened += 1
+
+    def close(self):
+        CountingEmailBackend.closed += 1
+
+    def send_messages(self, messages):
+        CountingEmailBackend.batches.append(len(messages))
+        return super(CountingEmailBackend, self).send_messages(messages)
+
+
+class RejectingEmailBackend(LocMemEmailBackend):
+    """
+    Fake email backend which rejects messages to bob.
+
+    Like the SMTP backend it stops at the first rejected message, messages
+    before it are already sent.
+    """
+
+    def send_messages(self, messages):
+        for i, message in enumerate(messages):
+            if 'bob@example.com' in message.to:
+                super(RejectingEmailBackend, self).send_messages(messages[:i])
+                raise IOError("Recipient refused")
+        return super(RejectingEmailBackend, self).send_messages(messages)
+
+
+class UnreachableEmailBackend(LocMemEmailBackend):
+    """
+    Fake email backend which counts attempts to open a connection and fails.
+    """
+
+    opened = 0
+
+    def open(self):
+        UnreachableEmailBackend.opened += 1
+        raise IOError("Connection refused")
+
+
+class FlakyEmailBackend(LocMemEmailBackend):
+    """
+    Fake email backend which fails given number of times.
+    """
+
+    failures = 0
+
+    def send_messages(self, messages):
+        if FlakyEmailBackend.failures:
+            FlakyEmailBackend.failures -= 1
+            raise IOError("This email backend is flaky")
+        return super(FlakyEmailBackend, self).send_messages(messages)
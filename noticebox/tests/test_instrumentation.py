@@ -0,0 +1,121 @@
+
+from django.db import connections
+from django.test.client import RequestFactory
+
+from noticebox.context_processors import notices
+from noticebox.handlers import DatabaseHandler, EmailHandler
+from noticebox.instrumentation import measure
+from noticebox.signals import phase_timed
+from noticebox.tests.base import BaseNoticeTestCase
+
+
+__all__ = ('InstrumentationTestCase',)
+
+
+class InstrumentationTestCase(BaseNoticeTestCase):
+    """
+    Tests sending of the `phase_timed` signal.
+    """
+
+    urls = 'noticebox.tests.urls'
+
+    def setUp(self):
+        self.phases = []
+        phase_timed.connect(self.receiver)
+
+    def tearDown(self):
+        phase_timed.disconnect(self.receiver)
+
+    def receiver(self, sender, phase, duration, count, queries, **kwargs):
+        self.phases.append((phase, count, queries))
+        self.assertTrue(duration >= 0)
+
+    def debug_cursors(self):
+        """
+        Returns a context manager which records queries of all connections.
+        """
+        return DebugCursors()
+
+    def get_phases(self, name):
+        return [(count, queries) for phase, count, queries in self.phases
+                if phase == name]
+
+    def test_inactive_without_receivers(self):
+        phase_timed.disconnect(self.receiver)
+        timer = measure('test')
+        self.assertFalse(timer.active)
+        timer.stop()
+        self.assertEqual([], self.phases)
+
+    def test_context_manager(self):
+        with measure('test', count=2):
+            pass
+        self.assertEqual([('test', 2, None)], self.phases)
+
+    def test_database_handler(self):
+        handler = DatabaseHandler()
+        handler([self.create_user('alice'), self.create_user('bob')])
+        self.assertEqual([(1, None), (1, None)], self.get_phases('render'))
+        self.assertEqual([(2, None)], self.get_phases('save'))
+        self.assertEqual([(2, None)], self.get_phases('database_handler'))
+
+    def test_email_handler(self):
+        handler = EmailHandler()
+        handler([self.create_user('alice'), self.create_user('bob', email='')])
+        self.assertEqual([(1, None)], self.get_phases('send'))
+        self.assertEqual([(2, None)], self.get_phases('email_handler'))
+
+    def test_email_handler_bulk(self):
+        handler = EmailHandler()
+        handler.bulk([(self.create_user('alice'), None, {}),
+                      (self.create_user('bob'), None, {})])
+        self.assertEqual([(2, None)], self.get_phases('send'))
+        self.assertEqual([(2, None)], self.get_phases('email_handler'))
+
+    def test_queries_are_counted(self):
+        handler = DatabaseHandler()
+        users = [self.create_user('alice'), self.create_user('bob')]
+        with self.debug_cursors():
+            handler(users)
+        self.assertEqual([(2, 1)], self.get_phases('save'))
+
+    def test_queries_are_not_counted_if_any_connection_does_not_record(self):
+        handler = DatabaseHandler()
+        users = [self.create_user('alice'), self.create_user('bob')]
+        with self.debug_cursors():
+            connections['shard'].use_debug_cursor = False
+            handler(users)
+        self.assertEqual([(2, None)], self.get_phases('save'))
+
+    def test_views(self):
+        user = self.create_user()
+        DatabaseHandler()(user)
+        self.client.login(username='alice', password='alice')
+        self.phases = []
+        self.client.get('/notices/')
+        self.client.post('/notices/read/')
+        self.assertEqual(['list_view', 'mark_read_view'],
+                         [phase for phase, count, queries in self.phases])
+
+    def test_context_processor(self):
+        DatabaseHandler()(self.create_user())
+        request = RequestFactory().get('/')
+        request.user = self.create_user('bob')
+        notices(request)['notice_unread_count']()
+        self.assertEqual([(0, None)], self.get_phases('count'))
+
+
+class DebugCursors(object):
+    """
+    Enables recording of queries by all connections while it is entered.
+    """
+
+    def __enter__(self):
+        self.saved = [(conn, conn.use_debug_cursor)
+                      for conn in connections.all()]
+        for conn, use_debug_cursor in self.saved:
+            conn.use_debug_cursor = True
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for conn, use_debug_cursor in self.saved:
+            conn.use_debug_cursor = use_debug_cursor
@@ -0,0 +1,67 @@
+
+from datetime import datetime, timedelta
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TransactionTestCase
+from django.utils.unittest import skipUnless
+
+from noticebox.models import Notice
+
+
+__all__ = ('NoticeIndexesTestCase',)
+
+
+def _explain(queryset):
+    sql, params = queryset.query.sql_with_params()
+    cursor = connection.cursor()
+    cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+    return ' '.join(row[-1] for row in cursor.fetchall())
+
+
+@skipUnless(connection.vendor == 'sqlite', "Query plans are SQLite specific.")
+class NoticeIndexesTestCase(TransactionTestCase):
+    """
+    Tests that queries used by views and context processor use indexes.
+
+    The SQLite driver commits a transaction before the EXPLAIN statement,
+    so this test case cannot run in a transaction. The table is seeded with
+    notices of many users and analyzed so that the query planner decides
+    using real statistics.
+    """
+
+    user_count = 50
+    notice_count = 100
+
+    def setUp(self):
+        User.objects.bulk_create([
+            User(username='user%d' % i, email='user%d@example.com' % i)
+            for i in range(self.user_count)])
+        users = list(User.objects.all())
+        self.user = users[0]
+        now = datetime.now()
+        for user in users:
+            # Every tenth notice is unread.
+            Notice.objects.bulk_create([
+                Notice(user=user, subject='Notice %d' % i, body='',
+                       atime=now if i % 10 else None)
+                for i in range(self.notice_count)])
+        connection.cursor().execute('ANALYZE')
+
+    def test_notice_list_uses_index(self):
+        queryset = Notice.objects.for_user(self.user).order_by('-ctime')
+        plan = _explain(queryset)
+        self.assertTrue('USING INDEX' in plan, plan)
+        self.assertFalse('TEMP B-TREE' in plan, plan)
+
+    def test_retention_batch_uses_index(self):
+        cutoff = datetime.now() - timedelta(days=30)
+        queryset = Notice.objects.filter(atime__isnull=False, ctime__lt=cutoff)
+        plan = _explain(queryset.order_by('ctime', 'pk'))
+        self.assertTrue('USING INDEX' in plan, plan)
+        self.assertFalse('TEMP B-TREE' in plan, plan)
+
+    def test_unread_count_uses_covering_index(self):
+        queryset = Notice.objects.for_user(self.user).filter(atime=None)
+        plan = _explain(queryset.values('pk'))
+        self.assertTrue('COVERING INDEX' in plan, plan)
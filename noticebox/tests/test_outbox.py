@@ -0,0 +1,79 @@
+
+from datetime import datetime
+
+from django.core.management import call_command
+
+from noticebox.models import Notice, OutboxJob
+from noticebox.outbox import OutboxHandler, Worker, defer_notice
+from noticebox.tests.base import BaseNoticeTestCase
+
+
+__all__ = ('OutboxTestCase',)
+
+
+def broken_handler(users, preset=None, **kwargs):
+    raise IOError("This handler is broken")
+
+
+class OutboxTestCase(BaseNoticeTestCase):
+    """
+    Tests the deferred delivery using the outbox.
+    """
+
+    def test_defer_to_empty_list(self):
+        defer_notice([])
+        self.assertEqual(0, OutboxJob.objects.count())
+
+    def test_defer_does_not_deliver(self):
+        defer_notice(self.create_user(), subject='Test subject', body='Test body')
+        self.assertEqual(2, OutboxJob.objects.count())
+        self.assertEqual(0, Notice.objects.count())
+        self.assertEqual(0, len(self.mail_outbox))
+
+    def test_worker_delivers_jobs(self):
+        defer_notice([self.create_user('alice'), self.create_user('bob')],
+                     subject='Test subject', body='Test body')
+        self.assertEqual(2, Worker().run_once())
+        self.assertEqual(0, OutboxJob.objects.count())
+        self.assertEqual(['<p>Test body</p>', '<p>Test body</p>'],
+                         [n.body for n in Notice.objects.all()])
+        self.assertEqual(['Test body', 'Test body'],
+                         [m.body for m in self.mail_outbox])
+
+    def test_worker_uses_preset(self):
+        defer_notice(self.create_user(), preset='hello')
+        Worker().run_once()
+        self.assertEqual('Hello alice!', Notice.objects.get().subject)
+        self.assertEqual('Hello alice!', self.mail_outbox[0].subject)
+
+    def test_failed_job_is_retried_later(self):
+        handler = OutboxHandler(
+            handlers=['noticebox.tests.test_outbox.broken_handler'])
+        handler(self.create_user())
+        self.assertEqual(1, Worker().run_once())
+        job = OutboxJob.objects.get()
+        self.assertEqual(1, job.attempts)
+        self.assertFalse(job.failed)
+        self.assertTrue(job.next_attempt > datetime.now())
+        self.assertTrue('This handler is broken' in job.error)
+        self.assertEqual(0, Worker().run_once())
+
+    def test_job_fails_after_max_attempts(self):
+        handler = OutboxHandler(
+            handlers=['noticebox.tests.test_outbox.broken_handler'])
+        handler(self.create_user())
+        Worker(max_attempts=1).run_once()
+        self.assertTrue(OutboxJob.objects.get().failed)
+
+    def test_locked_job_is_skipped(self):
+        defer_notice(self.create_user())
+        OutboxJob.objects.update(locked=datetime.now())
+        self.assertEqual(0, Worker().run_once())
+        self.assertEqual(2, Worker(lock_timeout=0).run_once())
+
+    def test_management_command(self):
+        defer_notice(self.create_user())
+        call_command('noticebox_outbox')
+        self.assertEqual(0, OutboxJob.objects.count())
+        self.assertEqual(1, Notice.objects.count())
+        self.assertEqual(1, len(self.mail_outbox))
@@ -0,0 +1,105 @@
+
+from datetime import datetime, timedelta
+
+from noticebox.models import Notice
+from noticebox.pagination import (
+    CursorPaginator, InvalidCursor, decode_cursor, encode_cursor)
+from noticebox.tests.base import BaseNoticeTestCase
+
+
+__all__ = ('CursorPaginatorTestCase', 'CursorPaginationViewTestCase')
+
+
+class CursorPaginatorTestCase(BaseNoticeTestCase):
+    """
+    Tests the `CursorPaginator` class.
+    """
+
+    def setUp(self):
+        self.user = self.create_user()
+        ctime = datetime(2013, 1, 1)
+        self.notices = []
+        for i in range(5):
+            notice = Notice.objects.create(user=self.user, subject=str(i))
+            # Two notices share the same creation time.
+            notice.ctime = ctime + timedelta(minutes=i // 2 * 2 + 1)
+            notice.save()
+            self.notices.insert(0, notice)
+        self.paginator = CursorPaginator(Notice.objects.all(), 2)
+
+    def subjects(self, page):
+        return [notice.subject for notice in page]
+
+    def test_cursor(self):
+        notice = self.notices[0]
+        self.assertEqual((notice.ctime, notice.pk),
+                         decode_cursor(encode_cursor(notice)))
+
+    def test_invalid_cursor(self):
+        self.assertRaises(InvalidCursor, decode_cursor, 'foo')
+        self.assertRaises(InvalidCursor, decode_cursor, 'foo.1')
+
+    def test_first_page(self):
+        page = self.paginator.page()
+        self.assertEqual(['4', '3'], self.subjects(page))
+        self.assertTrue(page.has_next())
+        self.assertFalse(page.has_previous())
+
+    def test_next_pages(self):
+        page = self.paginator.page(after=self.paginator.page().next_cursor)
+        self.assertEqual(['2', '1'], self.subjects(page))
+        self.assertTrue(page.has_next())
+        self.assertTrue(page.has_previous())
+        page = self.paginator.page(after=page.next_cursor)
+        self.assertEqual(['0'], self.subjects(page))
+        self.assertFalse(page.has_next())
+        self.assertTrue(page.has_previous())
+
+    def test_previous_pages(self):
+        page = self.paginator.page(before=encode_cursor(self.notices[-1]))
+        self.assertEqual(['2', '1'], self.subjects(page))
+        self.assertTrue(page.has_next())
+        self.assertTrue(page.has_previous())
+        page = self.paginator.page(before=page.previous_cursor)
+        self.assertEqual(['4', '3'], self.subjects(page))
+        self.assertTrue(page.has_next())
+        self.assertFalse(page.has_previous())
+
+    def test_notices_are_not_counted(self):
+        with self.assertNumQueries(1):
+            self.paginator.page()
+
+
+class CursorPaginationViewTestCase(BaseNoticeTestCase):
+    """
+    Tests the `NoticeListView` class with the cursor pagination.
+    """
+
+    urls = 'noticebox.tests.urls'
+
+    def setUp(self):
+        self.user = self.create_user('alice')
+        for subject in ('First', 'Second', 'Third'):
+            Notice.objects.create(user=self.user, subject=subject)
+        self.client.login(username='alice', password='alice')
+
+    def test_first_page(self):
+        r = self.client.get('/cursor-notices/')
+        self.assertContains(r, 'Third')
+        self.assertContains(r, 'Second')
+        self.assertNotContains(r, 'First')
+        self.assertContains(r, '?after=')
+        self.assertNotContains(r, '?before=')
+
+    def test_next_page(self):
+        r = self.client.get('/cursor-notices/')
+        cursor = r.context['page_obj'].next_cursor
+        r = self.client.get('/cursor-notices/', {'after': cursor})
+        self.assertContains(r, 'First')
+        self.assertNotContains(r, 'Second')
+        self.assertContains(r, '?before=')
+        self.assertNotContains(r, '?after=')
+
+    def test_invalid_cursor(self):
+        r = self.client.get('/cursor-notices/', {'after': 'foo'})
+        self.assertEqual(404, r.status_code)
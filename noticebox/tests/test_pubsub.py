@@ -0,0 +1,170 @@
+
+import json
+import threading
+import time
+
+from noticebox.handlers import save_notice
+from noticebox.models import Notice
+from noticebox.pagination import encode_cursor
+from noticebox.pubsub import LocMemBroker, get_broker
+from noticebox.tests.base import BaseNoticeTestCase
+from noticebox.views import NoticeStreamView
+
+
+__all__ = ('LocMemBrokerTestCase', 'NoticeStreamViewTestCase')
+
+
+BROKER = 'noticebox.pubsub.LocMemBroker'
+
+
+class LocMemBrokerTestCase(BaseNoticeTestCase):
+    """
+    Tests the `LocMemBroker` class.
+    """
+
+    def setUp(self):
+        self.broker = LocMemBroker()
+
+    def test_publish(self):
+        with self.broker.subscribe(1) as subscription:
+            self.broker.publish([1, 2], {'created': 1})
+            self.assertEqual([{'created': 1}], subscription.get(0))
+            self.assertEqual([], subscription.get(0))
+
+    def test_publish_to_other_user(self):
+        with self.broker.subscribe(1) as subscription:
+            self.broker.publish([2], {'created': 1})
+            self.assertEqual([], subscription.get(0))
+
+    def test_get_waits_for_message(self):
+        with self.broker.subscribe(1) as subscription:
+            threading.Timer(0.05, self.broker.publish,
+                            ([1], {'created': 1})).start()
+            start = time.time()
+            self.assertEqual([{'created': 1}], subscription.get(5))
+            self.assertTrue(time.time() - start < 5)
+
+    def test_close(self):
+        subscription = self.broker.subscribe(1)
+        subscription.close()
+        self.broker.publish([1], {'created': 1})
+        self.assertEqual([], subscription.get(0))
+        self.assertEqual({}, dict(self.broker._subscriptions))
+
+    def test_get_broker(self):
+        self.assertEqual(None, get_broker())
+        with self.settings(NOTICEBOX_BROKER=BROKER):
+            self.assertTrue(isinstance(get_broker(), LocMemBroker))
+            self.assertTrue(get_broker() is get_broker())
+
+    def test_created_notices_are_published(self):
+        alice = self.create_user('alice')
+        bob = self.create_user('bob')
+        with self.settings(NOTICEBOX_BROKER=BROKER):
+            with get_broker().subscribe(alice.pk) as subscription:
+                save_notice([alice, bob])
+                save_notice(alice)
+                self.assertEqual([{'created': 1}, {'created': 1}],
+                                 subscription.get(0))
+
+
+class NoticeStreamViewTestCase(BaseNoticeTestCase):
+    """
+    Tests the `NoticeStreamView` class.
+    """
+
+    urls = 'noticebox.tests.urls'
+
+    def __call__(self, *args, **kwargs):
+        with self.settings(NOTICEBOX_BROKER=BROKER):
+            super(NoticeStreamViewTestCase, self).__call__(*args, **kwargs)
+
+    def setUp(self):
+        self.user = self.create_user('alice')
+        self.url = '/notices/stream/'
+        self.client.login(username='alice', password='alice')
+        self.timeout = NoticeStreamView.timeout
+        self.max_duration = NoticeStreamView.max_duration
+        NoticeStreamView.timeout = 0.1
+        NoticeStreamView.max_duration = 0.1
+
+    def tearDown(self):
+        NoticeStreamView.timeout = self.timeout
+        NoticeStreamView.max_duration = self.max_duration
+
+    def publish_later(self, count=1):
+        threading.Timer(0.02, get_broker().publish,
+                        ([self.user.pk], {'created': count})).start()
+
+    def test_returns_302_if_not_logged_in(self):
+        self.client.logout()
+        r = self.client.get(self.url)
+        self.assertEqual(302, r.status_code)
+
+    def test_returns_404_if_not_enabled(self):
+        with self.settings(NOTICEBOX_BROKER=None):
+            r = self.client.get(self.url)
+        self.assertEqual(404, r.status_code)
+
+    def test_long_poll_timeout(self):
+        r = self.client.get(self.url)
+        self.assertEqual({'changed': False, 'created': 0},
+                         json.loads(r.content.decode('utf-8')))
+
+    def test_long_poll_is_woken(self):
+        NoticeStreamView.timeout = 5
+        self.publish_later(2)
+        with self.assertNumQueries(2):
+            # Only the session and the user are loaded.
+            r = self.client.get(self.url)
+        self.assertEqual({'changed': True, 'created': 2},
+                         json.loads(r.content.decode('utf-8')))
+
+    def test_long_poll_after_change(self):
+        save_notice(self.user)
+        notice = Notice.objects.get()
+        notice.ctime = notice.ctime.replace(year=2000)
+        r = self.client.get(self.url, {'after': encode_cursor(notice)})
+        self.assertEqual({'changed': True, 'created': 0},
+                         json.loads(r.content.decode('utf-8')))
+
+    def test_long_poll_after_read(self):
+        save_notice(self.user)
+        notice = Notice.objects.get()
+        Notice.objects.mark_read(self.user)
+        with self.settings(NOTICEBOX_CACHE='default'):
+            r = self.client.get(self.url, {'after': encode_cursor(notice)})
+        self.assertEqual({'changed': False, 'created': 0},
+                         json.loads(r.content.decode('utf-8')))
+
+    def test_invalid_cursor(self):
+        r = self.client.get(self.url, {'after': 'invalid'})
+        self.assertEqual(400, r.status_code)
+        self.assertEqual({}, dict(get_broker()._subscriptions))
+
+    def test_event_stream(self):
+        NoticeStreamView.max_duration = 0.5
+        self.publish_later()
+        r = self.client.get(self.url, HTTP_ACCEPT='text/event-stream')
+        self.assertEqual('text/event-stream', r['Content-Type'])
+        content = b''.join(r.streaming_content).decode('utf-8')
+        self.assertTrue(content.startswith('retry: 3000\n\n'))
+        self.assertTrue('event: notices\ndata: {"created": 1}\n\n' in content)
+        self.assertEqual({}, dict(get_broker()._subscriptions))
+
+    def test_unconsumed_event_stream(self):
+        r = self.client.get(self.url, HTTP_ACCEPT='text/event-stream')
+        self.assertEqual({}, dict(get_broker()._subscriptions))
+        next(iter(r.streaming_content))
+        self.assertEqual([self.user.pk], list(get_broker()._subscriptions))
+        r.close()
+        self.assertEqual({}, dict(get_broker()._subscriptions))
+
+    def test_event_stream_after_change(self):
+        save_notice(self.user)
+        notice = Notice.objects.get()
+        notice.ctime = notice.ctime.replace(year=2000)
+        r = self.client.get(self.url, {'after': encode_cursor(notice)},
+                            HTTP_ACCEPT='text/event-stream')
+        content = b''.join(r.streaming_content).decode('utf-8')
+        self.assertTrue('event: notices\ndata: {"created": 0}\n\n' in content)
@@ -0,0 +1,110 @@
+
+from datetime import datetime, timedelta
+
+from django.core.management import call_command
+
+from noticebox.counters import count_unread
+from noticebox.handlers import DatabaseHandler
+from noticebox.models import Notice, NoticeContent, NoticeCounter
+from noticebox.retention import RetentionPolicy
+from noticebox.tests.base import BaseNoticeTestCase
+
+
+__all__ = ('RetentionPolicyTestCase',)
+
+
+class ArchivingRetentionPolicy(RetentionPolicy):
+
+    def __init__(self, **kwargs):
+        self.archived = []
+        super(ArchivingRetentionPolicy, self).__init__(**kwargs)
+
+    def archive(self, queryset):
+        self.archived.extend(queryset.values_list('subject', flat=True))
+
+
+class ReadingRetentionPolicy(RetentionPolicy):
+    """
+    The user reads notices after they were selected for deletion.
+    """
+
+    def archive(self, queryset):
+        for notice in queryset:
+            Notice.objects.mark_read(notice.user, pks=[notice.pk])
+
+
+class RetentionPolicyTestCase(BaseNoticeTestCase):
+    """
+    Tests the `RetentionPolicy` class.
+    """
+
+    def setUp(self):
+        self.user = self.create_user()
+        now = datetime.now()
+        for days, read in ((30, True), (20, False), (10, True), (0, False)):
+            notice = Notice.objects.create(user=self.user, subject=str(days))
+            notice.ctime = now - timedelta(days=days, hours=1)
+            notice.atime = now if read else None
+            notice.save()
+
+    def subjects(self):
+        return sorted(Notice.objects.values_list('subject', flat=True))
+
+    def test_nothing_is_deleted_by_default(self):
+        self.assertEqual(0, RetentionPolicy().apply())
+        self.assertEqual(['0', '10', '20', '30'], self.subjects())
+
+    def test_read_days(self):
+        self.assertEqual(2, RetentionPolicy(read_days=5).apply())
+        self.assertEqual(['0', '20'], self.subjects())
+
+    def test_unread_days(self):
+        self.assertEqual(1, RetentionPolicy(unread_days=15).apply())
+        self.assertEqual(['0', '10', '30'], self.subjects())
+
+    def test_max_per_user(self):
+        Notice.objects.create(user=self.create_user('bob'), subject='bob')
+        self.assertEqual(2, RetentionPolicy(max_per_user=2).apply())
+        self.assertEqual(['0', '10', 'bob'], self.subjects())
+
+    def test_batches(self):
+        policy = ArchivingRetentionPolicy(read_days=0, unread_days=0,
+                                          batch_size=1)
+        self.assertEqual(4, policy.apply())
+        self.assertEqual(['30', '10', '20', '0'], policy.archived)
+
+    def test_notice_read_before_deletion(self):
+        with self.settings(NOTICEBOX_COUNTERS=True):
+            self.assertEqual(2, count_unread(self.user))
+            policy = ReadingRetentionPolicy(unread_days=15)
+            self.assertEqual(1, policy.apply())
+            self.assertEqual(1, count_unread(self.user))
+            self.assertEqual(3, NoticeCounter.objects.get(user=self.user).total)
+
+    def test_counters_are_updated(self):
+        with self.settings(NOTICEBOX_COUNTERS=True):
+            self.assertEqual(2, count_unread(self.user))
+            RetentionPolicy(unread_days=15).apply()
+            self.assertEqual(1, count_unread(self.user))
+            self.assertEqual(3, NoticeCounter.objects.get(user=self.user).total)
+
+    def test_unused_contents_are_deleted(self):
+        handler = DatabaseHandler(deduplicate=True)
+        handler(self.user, subject='Kept')
+        handler(self.user, subject='Deleted')
+        Notice.objects.filter(content__subject='Deleted').update(
+            ctime=datetime.now() - timedelta(days=100))
+        RetentionPolicy(unread_days=50).apply()
+        self.assertEqual(['Kept'], [c.subject
+                                    for c in NoticeContent.objects.all()])
+
+    def test_settings(self):
+        with self.settings(NOTICEBOX_KEEP_READ_DAYS=5):
+            policy = RetentionPolicy.from_settings(max_per_user=1)
+        self.assertEqual(5, policy.read_days)
+        self.assertEqual(None, policy.unread_days)
+        self.assertEqual(1, policy.max_per_user)
+
+    def test_management_command(self):
+        call_command('noticebox_cleanup', read_days=5, verbosity=0)
+        self.assertEqual(['0', '20'], self.subjects())
@@ -0,0 +1,137 @@
+
+from django.core.management.color import no_style
+from django.db import connections, router
+from django.db.models import get_models
+from django.test.client import RequestFactory
+from django.template.context import RequestContext
+
+from noticebox.handlers import save_notice
+from noticebox.models import Notice, NoticeCounter
+from noticebox.retention import RetentionPolicy
+from noticebox.routers import NoticeRouter, get_shards, shard_for_user
+from noticebox.signals import phase_timed
+from noticebox.tests.base import BaseNoticeTestCase
+from noticebox.tests.test_instrumentation import DebugCursors
+
+
+__all__ = ('ShardedNoticesTestCase',)
+
+
+SHARDS = ['default', 'shard']
+
+
+class ShardedNoticesTestCase(BaseNoticeTestCase):
+    """
+    Tests storage of notices in multiple databases.
+    """
+
+    multi_db = True
+    urls = 'noticebox.tests.urls'
+
+    def __call__(self, *args, **kwargs):
+        # Routers are loaded only once, the DATABASE_ROUTERS setting
+        # cannot be overridden.
+        routers = router.routers
+        router.routers = [NoticeRouter()]
+        try:
+            with self.settings(NOTICEBOX_SHARDS=SHARDS):
+                super(ShardedNoticesTestCase, self).__call__(*args, **kwargs)
+        finally:
+            router.routers = routers
+
+    def setUp(self):
+        self.alice = self.create_user('alice')
+        self.bob = self.create_user('bob')
+        # Make sure that users are stored in different databases.
+        if shard_for_user(self.alice) == shard_for_user(self.bob):
+            self.bob = self.create_user('cecil')
+
+    def count(self, alias, user):
+        return Notice.objects.using(alias).filter(user=user).count()
+
+    def test_shards(self):
+        self.assertEqual(SHARDS, get_shards())
+        self.assertEqual(set(SHARDS), set([shard_for_user(self.alice),
+                                           shard_for_user(self.bob)]))
+
+    def test_shards_not_configured(self):
+        with self.settings(NOTICEBOX_SHARDS=None):
+            self.assertEqual(['default'], get_shards())
+            self.assertEqual(None, shard_for_user(self.alice))
+
+    def test_notices_are_saved_to_shards(self):
+        save_notice([self.alice, self.bob])
+        for user in (self.alice, self.bob):
+            self.assertEqual(1, self.count(shard_for_user(user), user))
+            self.assertEqual(1, Notice.objects.for_user(user).count())
+
+    def test_queries_of_shards_are_measured(self):
+        phases = []
+        receiver = lambda phase, queries, **kwargs: phases.append(
+            (phase, queries))
+        phase_timed.connect(receiver)
+        try:
+            with DebugCursors():
+                save_notice([self.alice, self.bob])
+        finally:
+            phase_timed.disconnect(receiver)
+        # One insert into each shard, not only into the default database.
+        self.assertEqual([('save', 2)],
+                         [item for item in phases if item[0] == 'save'])
+
+    def test_notice_user(self):
+        save_notice(self.alice)
+        notice = Notice.objects.for_user(self.alice).get()
+        self.assertEqual(shard_for_user(self.alice), notice._state.db)
+        self.assertEqual(self.alice, notice.user)
+
+    def test_views(self):
+        save_notice(self.alice, subject='Hello alice')
+        notice = Notice.objects.for_user(self.alice).get()
+        self.client.login(username='alice', password='alice')
+        r = self.client.get('/notices/')
+        self.assertContains(r, 'Hello alice')
+        r = self.client.get(notice.get_absolute_url())
+        self.assertContains(r, 'Hello alice')
+        self.assertTrue(Notice.objects.for_user(self.alice).get().is_read)
+
+    def test_context_processor(self):
+        save_notice([self.alice, self.bob])
+        request = RequestFactory().get('/')
+        request.user = self.alice
+        self.assertEqual(1, RequestContext(request)['notice_unread_count']())
+
+    def test_counters_rebuild(self):
+        save_notice([self.alice, self.bob])
+        NoticeCounter.objects.rebuild()
+        self.assertEqual([1, 1], [c.total for c in NoticeCounter.objects.all()])
+
+    def test_router(self):
+        notice = Notice(user=self.alice)
+        shard = shard_for_user(self.alice)
+        self.assertEqual(shard, router.db_for_write(Notice, instance=notice))
+        self.assertEqual(shard, router.db_for_read(Notice, instance=notice))
+        self.assertEqual('default', router.db_for_read(type(self.alice),
+                                                       instance=notice))
+        self.assertTrue(router.allow_syncdb('shard', Notice))
+        self.assertTrue(router.allow_relation(notice, self.alice))
+
+    def test_users_are_not_synced_to_shards(self):
+        User = type(self.alice)
+        self.assertTrue(router.allow_syncdb('default', User))
+        self.assertFalse(router.allow_syncdb('shard', User))
+        # Tables created by syncdb in the shard, notices do not reference
+        # the users table.
+        known_models = set(model for model in get_models()
+                           if router.allow_syncdb('shard', model))
+        creation = connections['shard'].creation
+        sql, references = creation.sql_create_model(
+            Notice, no_style(), known_models)
+        self.assertFalse(User._meta.db_table in ' '.join(sql), sql)
+
+    def test_retention(self):
+        save_notice([self.alice, self.bob])
+        self.assertEqual(2, RetentionPolicy(max_per_user=0).apply())
+        for alias in SHARDS:
+            self.assertEqual(0, Notice.objects.using(alias).count())
+
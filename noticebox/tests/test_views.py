@@ -1,9 +1,17 @@
 
+import json
+from datetime import datetime, timedelta
+
+from django.core.cache import cache
+
+from noticebox.handlers import DatabaseHandler, save_notice
 from noticebox.models import Notice
+from noticebox.pagination import encode_cursor
 from noticebox.tests.base import BaseNoticeTestCase
 
 
-__all__ = ('NoticeListViewTestCase', 'NoticeDetailViewTestCase')
+__all__ = ('NoticeListViewTestCase', 'NoticeDetailViewTestCase',
+           'NoticeMarkReadViewTestCase', 'NoticePollViewTestCase')
 
 
 class NoticeListViewTestCase(BaseNoticeTestCase):
@@ -39,6 +47,13 @@ class NoticeListViewTestCase(BaseNoticeTestCase):
         r = self.client.get('/notices/')
         self.assertContains(r, 'Hello <i>alice</i>!')
 
+    def test_body_is_not_loaded(self):
+        self.client.login(username='alice', password='alice')
+        r = self.client.get('/notices/')
+        sql = str(r.context['paginator'].object_list.query)
+        self.assertTrue('subject' in sql)
+        self.assertFalse('body' in sql)
+
 
 class NoticeDetailViewTestCase(BaseNoticeTestCase):
     """
@@ -70,8 +85,167 @@ class NoticeDetailViewTestCase(BaseNoticeTestCase):
         self.assertContains(r, 'Hello <i>alice</i>!')
         self.assertContains(r, 'Hello <i>alice</i>, how are you?')
 
+    def test_deduplicated_content(self):
+        DatabaseHandler(deduplicate=True)(
+            self.user, subject='Shared subject', body='Shared body')
+        notice = Notice.objects.get(subject='')
+        self.client.login(username='alice', password='alice')
+        r = self.client.get('/notices/%d/' % notice.id)
+        self.assertContains(r, 'Shared subject')
+        self.assertContains(r, 'Shared body')
+
     def test_notice_is_marked_as_read(self):
         self.client.login(username='alice', password='alice')
         self.client.get(self.url)
         notice = Notice.objects.get(id=self.notice.id)
         self.assertTrue(notice.is_read)
+
+    def test_read_notice_is_not_updated(self):
+        atime = datetime(2013, 1, 1)
+        Notice.objects.filter(pk=self.notice.pk).update(atime=atime)
+        self.client.login(username='alice', password='alice')
+        self.client.get(self.url)
+        self.assertEqual(atime, Notice.objects.get(id=self.notice.id).atime)
+
+
+class NoticeMarkReadViewTestCase(BaseNoticeTestCase):
+    """
+    Tests the `NoticeMarkReadView` class.
+    """
+
+    urls = 'noticebox.tests.urls'
+
+    def setUp(self):
+        self.user = self.create_user('alice')
+        self.notices = []
+        for days in (3, 2, 1):
+            notice = Notice.objects.create(user=self.user, subject='Hello')
+            notice.ctime = datetime.now() - timedelta(days=days)
+            notice.save()
+            self.notices.append(notice)
+        self.other_notice = Notice.objects.create(
+            user=self.create_user('bob'), subject='Hello')
+        self.url = '/notices/read/'
+
+    def get_read(self):
+        return [Notice.objects.get(pk=n.pk).is_read for n in self.notices]
+
+    def test_returns_302_if_not_logged_in(self):
+        r = self.client.post(self.url)
+        self.assertEqual(302, r.status_code)
+        self.assertEqual([False, False, False], self.get_read())
+
+    def test_returns_405_for_get(self):
+        self.client.login(username='alice', password='alice')
+        r = self.client.get(self.url)
+        self.assertEqual(405, r.status_code)
+
+    def test_mark_all(self):
+        self.client.login(username='alice', password='alice')
+        r = self.client.post(self.url)
+        self.assertRedirects(r, '/notices/')
+        self.assertEqual([True, True, True], self.get_read())
+        self.assertFalse(Notice.objects.get(pk=self.other_notice.pk).is_read)
+
+    def test_mark_selected(self):
+        self.client.login(username='alice', password='alice')
+        pks = [self.notices[0].pk, self.notices[2].pk, self.other_notice.pk]
+        self.client.post(self.url, {'notice': pks})
+        self.assertEqual([True, False, True], self.get_read())
+        self.assertFalse(Notice.objects.get(pk=self.other_notice.pk).is_read)
+
+    def test_mark_until(self):
+        self.client.login(username='alice', password='alice')
+        self.client.post(self.url, {'until': encode_cursor(self.notices[1])})
+        self.assertEqual([True, True, False], self.get_read())
+
+    def test_invalid_arguments(self):
+        self.client.login(username='alice', password='alice')
+        r = self.client.post(self.url, {'notice': 'foo'})
+        self.assertEqual(400, r.status_code)
+
+    def test_redirect_to_next(self):
+        self.client.login(username='alice', password='alice')
+        r = self.client.post(self.url, {'next': '/notices/?page=1'})
+        self.assertRedirects(r, '/notices/?page=1')
+
+    def test_mark_with_single_update(self):
+        self.client.login(username='alice', password='alice')
+        with self.assertNumQueries(1):
+            self.assertEqual(3, Notice.objects.mark_read(self.user))
+        self.assertEqual(0, Notice.objects.mark_read(self.user))
+
+
+class NoticePollViewTestCase(BaseNoticeTestCase):
+    """
+    Tests the `NoticePollView` class.
+    """
+
+    urls = 'noticebox.tests.urls'
+
+    def __call__(self, *args, **kwargs):
+        with self.settings(NOTICEBOX_CACHE='default'):
+            super(NoticePollViewTestCase, self).__call__(*args, **kwargs)
+
+    def setUp(self):
+        cache.clear()
+        self.user = self.create_user('alice')
+        self.notices = []
+        for days in (3, 2, 1):
+            notice = Notice.objects.create(user=self.user, subject='Hello')
+            notice.ctime = datetime.now() - timedelta(days=days)
+            notice.save()
+            self.notices.append(notice)
+        self.url = '/notices/poll/'
+        self.client.login(username='alice', password='alice')
+
+    def poll(self, **kwargs):
+        r = self.client.get(self.url, **kwargs)
+        self.assertEqual(200, r.status_code)
+        self.assertEqual('application/json', r['Content-Type'])
+        return r, json.loads(r.content.decode('utf-8'))
+
+    def test_returns_302_if_not_logged_in(self):
+        self.client.logout()
+        r = self.client.get(self.url)
+        self.assertEqual(302, r.status_code)
+
+    def test_returns_newest_notices(self):
+        r, data = self.poll()
+        self.assertEqual(3, data['unread_count'])
+        self.assertEqual([n.pk for n in reversed(self.notices)],
+                         data['notices'])
+        self.assertEqual(encode_cursor(self.notices[2]), data['cursor'])
+
+    def test_returns_notices_after_cursor(self):
+        cursor = encode_cursor(self.notices[0])
+        r, data = self.poll(data={'after': cursor})
+        self.assertEqual([self.notices[2].pk, self.notices[1].pk],
+                         data['notices'])
+        r, data = self.poll(data={'after': data['cursor']})
+        self.assertEqual([], data['notices'])
+        self.assertEqual(encode_cursor(self.notices[2]), data['cursor'])
+
+    def test_invalid_cursor(self):
+        r = self.client.get(self.url, {'after': 'invalid'})
+        self.assertEqual(400, r.status_code)
+
+    def test_not_modified(self):
+        r, data = self.poll()
+        self.assertTrue(r.has_header('Last-Modified'))
+        with self.assertNumQueries(2):
+            # Only the session and the user are loaded.
+            r = self.client.get(self.url, HTTP_IF_NONE_MATCH=r['ETag'])
+        self.assertEqual(304, r.status_code)
+
+    def test_modified_by_new_notice(self):
+        r, data = self.poll()
+        save_notice(self.user)
+        r, data = self.poll(HTTP_IF_NONE_MATCH=r['ETag'])
+        self.assertEqual(4, data['unread_count'])
+
+    def test_modified_by_read_notice(self):
+        r, data = self.poll()
+        Notice.objects.mark_read(self.user, pks=[self.notices[0].pk])
+        r, data = self.poll(HTTP_IF_NONE_MATCH=r['ETag'])
+        self.assertEqual(2, data['unread_count'])
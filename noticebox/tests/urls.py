@@ -1,7 +1,11 @@
 
 from django.conf.urls import patterns, url, include
 
+from noticebox.views import NoticeListView
+
 
 urlpatterns = patterns('',
     url('^notices/', include('noticebox.urls')),
+    url('^cursor-notices/$',
+        NoticeListView.as_view(cursor_pagination=True, paginate_by=2)),
 )
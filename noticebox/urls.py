@@ -1,10 +1,15 @@
 
 from django.conf.urls import patterns, url
 
-from noticebox.views import NoticeListView, NoticeDetailView
+from noticebox.views import (
+    NoticeListView, NoticeDetailView, NoticeMarkReadView, NoticePollView,
+    NoticeStreamView)
 
 
 urlpatterns = patterns('',
     url(r'^$', NoticeListView.as_view(), name='notice_list'),
     url(r'^(?P<pk>\d+)/$', NoticeDetailView.as_view(), name='notice_detail'),
+    url(r'^read/$', NoticeMarkReadView.as_view(), name='notice_mark_read'),
+    url(r'^poll/$', NoticePollView.as_view(), name='notice_poll'),
+    url(r'^stream/$', NoticeStreamView.as_view(), name='notice_stream'),
 )
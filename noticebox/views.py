@@ -1,40 +1,296 @@
 
+import json
+import time
+
 from django.contrib.auth.decorators import login_required
+from django.core.urlresolvers import reverse
+from django.db.models import Q
+from django.http import (
+    Http404, HttpResponse, HttpResponseBadRequest, HttpResponseRedirect,
+    StreamingHttpResponse)
 from django.utils.decorators import method_decorator
-from django.views.generic import ListView, DetailView
+from django.utils.http import is_safe_url
+from django.views.decorators.http import condition
+from django.views.generic import ListView, DetailView, View
 
+from noticebox.counters import count_unread, last_modified
+from noticebox.instrumentation import measure
 from noticebox.models import Notice
+from noticebox.pagination import (
+    CursorPaginator, InvalidCursor, decode_cursor, encode_cursor)
+from noticebox.pubsub import get_broker
+
+
+class InstrumentedViewMixin(object):
+    """
+    Measures the view including rendering of its template response.
+
+    The `phase_timed` signal is sent with the `phase` of the view.
+    """
+
+    phase = None
+
+    def dispatch(self, *args, **kwargs):
+        timer = measure(self.phase, type(self))
+        if not timer.active:
+            return super(InstrumentedViewMixin, self).dispatch(*args, **kwargs)
+        try:
+            response = super(InstrumentedViewMixin, self).dispatch(
+                *args, **kwargs)
+        except Exception:
+            timer.stop()
+            raise
+        if getattr(response, 'is_rendered', True):
+            timer.stop()
+        else:
+            response.add_post_render_callback(lambda response: timer.stop())
+        return response
 
 
-class NoticeListView(ListView):
+class NoticeListView(InstrumentedViewMixin, ListView):
     """
     A view which displays a list of user's notices.
+
+    If `cursor_pagination` is enabled then pages are identified by cursors
+    given in the `after` and `before` GET parameters instead of page numbers.
+    Such pages are equally fast regardless of their position, but the total
+    number of pages is not known.
     """
 
     paginate_by = 20
+    cursor_pagination = False
+    phase = 'list_view'
 
     @method_decorator(login_required)
     def dispatch(self, *args, **kwargs):
         return super(NoticeListView, self).dispatch(*args, **kwargs)
 
     def get_queryset(self):
-        return Notice.objects.for_user(self.request.user).order_by('-ctime')
+        queryset = Notice.objects.list_for_user(self.request.user)
+        return queryset.order_by('-ctime')
+
+    def paginate_queryset(self, queryset, page_size):
+        if not self.cursor_pagination:
+            return super(NoticeListView, self).paginate_queryset(
+                queryset, page_size)
+        paginator = CursorPaginator(queryset, page_size)
+        try:
+            page = paginator.page(after=self.request.GET.get('after'),
+                                  before=self.request.GET.get('before'))
+        except InvalidCursor:
+            raise Http404("Invalid cursor.")
+        return (paginator, page, page.object_list, page.has_other_pages())
 
+    def get_context_data(self, **kwargs):
+        context = super(NoticeListView, self).get_context_data(**kwargs)
+        context['cursor_pagination'] = self.cursor_pagination
+        return context
 
-class NoticeDetailView(DetailView):
+
+class NoticeDetailView(InstrumentedViewMixin, DetailView):
     """
     A view which displays notice detail and marks is as read.
     """
 
+    phase = 'detail_view'
+
     @method_decorator(login_required)
     def dispatch(self, *args, **kwargs):
         return super(NoticeDetailView, self).dispatch(*args, **kwargs)
 
     def get_object(self, *args, **kwargs):
         instance = super(NoticeDetailView, self).get_object(*args, **kwargs)
-        instance.is_read = True
-        instance.save(force_update=True)
+        if not instance.is_read:
+            # Only the atime column of an unread notice is updated.
+            Notice.objects.mark_read(self.request.user, pks=[instance.pk])
+            instance.is_read = True
         return instance
 
     def get_queryset(self):
-        return Notice.objects.for_user(self.request.user)
+        return Notice.objects.for_user(self.request.user) \
+            .select_related('content')
+
+
+class NoticeMarkReadView(InstrumentedViewMixin, View):
+    """
+    A view which marks notices as read and redirects back to the list.
+
+    All user's notices are marked unless ids of notices are given in
+    the `notice` POST parameter or a cursor of the last notice to be marked
+    is given in the `until` parameter.
+    """
+
+    http_method_names = ['post']
+    phase = 'mark_read_view'
+
+    @method_decorator(login_required)
+    def dispatch(self, *args, **kwargs):
+        return super(NoticeMarkReadView, self).dispatch(*args, **kwargs)
+
+    def post(self, request, *args, **kwargs):
+        pks = request.POST.getlist('notice') or None
+        until = request.POST.get('until') or None
+        try:
+            if pks is not None:
+                pks = [int(pk) for pk in pks]
+            if until is not None:
+                until = decode_cursor(until)[0]
+        except ValueError:
+            return HttpResponseBadRequest()
+        Notice.objects.mark_read(request.user, pks=pks, until=until)
+        return HttpResponseRedirect(self.get_success_url())
+
+    def get_success_url(self):
+        url = self.request.POST.get('next')
+        if url and is_safe_url(url, host=self.request.get_host()):
+            return url
+        return reverse('notice_list')
+
+
+def _last_modified(request, *args, **kwargs):
+    """
+    Returns time of the last change of user's notices, once per request.
+    """
+    try:
+        return request._noticebox_last_modified
+    except AttributeError:
+        request._noticebox_last_modified = last_modified(request.user)
+    return request._noticebox_last_modified
+
+
+def _poll_etag(request, *args, **kwargs):
+    modified = _last_modified(request)
+    if modified is None:
+        return None
+    return '%s/%s' % (modified.isoformat(), request.GET.get('after', ''))
+
+
+class NoticePollView(InstrumentedViewMixin, View):
+    """
+    A view which returns the unread count and new notices in JSON.
+
+    Ids of notices created after the cursor given in the `after` GET
+    parameter (or of the newest notices) are returned together with a cursor
+    of the newest one. The response has ETag and Last-Modified headers
+    derived from the time of the last change of user's notices, so that
+    polls are answered by 304 responses if nothing has changed. The time is
+    taken from the cache if `NOTICEBOX_CACHE` is configured.
+    """
+
+    http_method_names = ['get']
+    phase = 'poll_view'
+    # Maximal number of returned notice ids.
+    limit = 20
+
+    @method_decorator(login_required)
+    def dispatch(self, *args, **kwargs):
+        return super(NoticePollView, self).dispatch(*args, **kwargs)
+
+    @method_decorator(condition(etag_func=_poll_etag,
+                                last_modified_func=_last_modified))
+    def get(self, request, *args, **kwargs):
+        after = request.GET.get('after') or None
+        queryset = Notice.objects.for_user(request.user)
+        try:
+            page = CursorPaginator(queryset.only('pk', 'ctime'),
+                                   self.limit).page(before=after)
+        except InvalidCursor:
+            return HttpResponseBadRequest()
+        notices = list(page)
+        data = {
+            'unread_count': count_unread(request.user),
+            'notices': [notice.pk for notice in notices],
+            'cursor': encode_cursor(notices[0]) if notices else after,
+        }
+        return HttpResponse(json.dumps(data), content_type='application/json')
+
+
+class NoticeStreamView(View):
+    """
+    A view which waits until new notices are created for the user.
+
+    Requires a broker configured by the `NOTICEBOX_BROKER` setting (see
+    `noticebox.pubsub`). If the client accepts `text/event-stream` then
+    server-sent events are streamed for `max_duration` seconds, otherwise
+    the view waits at most `timeout` seconds and returns a JSON object with
+    the number of `created` notices (long polling).
+
+    If a cursor of the newest notice known to the client is given in
+    the `after` parameter then the client is notified immediately if newer
+    notices were created for the user. Reading of notices is not a change.
+    """
+
+    http_method_names = ['get']
+    timeout = 30
+    heartbeat = 15
+    max_duration = 300
+    retry = 3000
+
+    @method_decorator(login_required)
+    def dispatch(self, *args, **kwargs):
+        return super(NoticeStreamView, self).dispatch(*args, **kwargs)
+
+    def get(self, request, *args, **kwargs):
+        broker = get_broker()
+        if broker is None:
+            raise Http404("Notice streaming is not enabled.")
+        after = request.GET.get('after') or None
+        try:
+            after = decode_cursor(after) if after is not None else None
+        except InvalidCursor:
+            return HttpResponseBadRequest()
+        if 'text/event-stream' in request.META.get('HTTP_ACCEPT', ''):
+            response = StreamingHttpResponse(
+                self.stream(broker, after), content_type='text/event-stream')
+            response['Cache-Control'] = 'no-cache'
+            return response
+        created = 0
+        # Subscribe before checking for changes so that nothing is missed.
+        with broker.subscribe(request.user.pk) as subscription:
+            changed = self.is_changed(after)
+            if not changed:
+                messages = subscription.get(self.timeout)
+                created = sum(message['created'] for message in messages)
+        data = {'changed': changed or bool(created), 'created': created}
+        return HttpResponse(json.dumps(data), content_type='application/json')
+
+    def is_changed(self, after):
+        """
+        Returns whether notices were created after the given notice.
+
+        The `after` argument is the creation time and id of the notice
+        (a decoded cursor) or None.
+        """
+        if after is None:
+            return False
+        ctime, pk = after
+        return Notice.objects.for_user(self.request.user).filter(
+            Q(ctime__gt=ctime) | Q(ctime=ctime, pk__gt=pk)).exists()
+
+    def stream(self, broker, after):
+        """
+        Yields server-sent events until `max_duration` elapses.
+
+        The user is subscribed when the first event is requested and
+        unsubscribed when the stream ends or is closed, so nothing leaks
+        if the response is never consumed.
+        """
+        end = time.time() + self.max_duration
+        with broker.subscribe(self.request.user.pk) as subscription:
+            yield 'retry: %d\n\n' % self.retry
+            if self.is_changed(after):
+                yield self.format_event({'created': 0})
+            while True:
+                remaining = end - time.time()
+                if remaining <= 0:
+                    break
+                messages = subscription.get(min(self.heartbeat, remaining))
+                if messages:
+                    created = sum(message['created'] for message in messages)
+                    yield self.format_event({'created': created})
+                else:
+                    # Keeps the connection opened.
+                    yield ': keepalive\n\n'
+
+    def format_event(self, data):
+        return 'event: notices\ndata: %s\n\n' % json.dumps(data)
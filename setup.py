@@ -24,6 +24,7 @@ setup(
     author_email='miloslav.pojman@gmail.com',
     url=url,
     packages=find_packages(),
+    install_requires=['Django>=1.5'],
     classifiers=[
         'Environment :: Web Environment',
         'Intended Audience :: Developers',